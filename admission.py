@@ -0,0 +1,111 @@
+"""
+Admission Control - Bounded concurrency with a priority wait queue
+Sheds load with a fast rejection instead of letting requests pile up until clients time out
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class _Waiter:
+    """A request waiting for a free slot"""
+    __slots__ = ('priority', 'seq', 'shed')
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.shed = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int):
+        """
+        Initialize admission controller
+
+        Args:
+            max_concurrent: Requests allowed to run at the same time
+            max_queue: Requests allowed to wait for a slot (lower priority ones are shed first)
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiters = []  # heap of _Waiter, lowest priority value runs first
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.shed = 0
+
+    def acquire(self, priority: int, deadline: float) -> bool:
+        """
+        Try to start a request within `deadline` seconds
+        Lower priority values win. Returns False if the request should be shed.
+        """
+        with self._cond:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self.admitted += 1
+                return True
+
+            if len(self._waiters) >= self.max_queue:
+                # Queue full - evict the worst waiter if we outrank it, else shed ourselves
+                worst = max(self._waiters)
+                if worst.priority <= priority:
+                    self.shed += 1
+                    return False
+                worst.shed = True
+                self._waiters.remove(worst)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+            waiter = _Waiter(priority, next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+            expires = time.monotonic() + deadline
+
+            while True:
+                if waiter.shed:
+                    self.shed += 1
+                    return False
+                if self._active < self.max_concurrent and self._waiters[0] is waiter:
+                    heapq.heappop(self._waiters)
+                    self._active += 1
+                    self.admitted += 1
+                    # Let the next waiter check for a remaining free slot
+                    self._cond.notify_all()
+                    return True
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                    self.shed += 1
+                    return False
+                self._cond.wait(remaining)
+
+    def release(self):
+        """Free a slot taken by acquire()"""
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def retry_after(self) -> int:
+        """Suggested Retry-After in seconds based on current backlog"""
+        with self._cond:
+            backlog = len(self._waiters) + self._active
+        return max(1, backlog // max(1, self.max_concurrent))
+
+    def snapshot(self) -> dict:
+        """Current load counters"""
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "shed": self.shed
+            }
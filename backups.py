@@ -0,0 +1,187 @@
+"""
+Backups - Rotated point-in-time snapshots of the license table
+A background thread periodically saves the table as of one journal sequence number into a
+gzip'd generation whose SHA-256 is kept in a manifest. Reading a fixed version of the table
+only briefly pins the store (see LicenseStore.export, which is safe beside request threads),
+so requests never wait on a backup.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows - single process dev server only
+    fcntl = None
+
+
+class BackupManager:
+    def __init__(self, store, backup_dir: str, keep: int = 24, interval: float = 3600.0, logger=None):
+        """
+        Initialize backup manager
+
+        Args:
+            store: LicenseStore to back up
+            backup_dir: Directory for generations and their manifest
+            keep: Generations kept; the oldest is deleted past this
+            interval: Seconds between background backups
+        """
+        self.store = store
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.interval = interval
+        self.logger = logger
+        self.manifest_file = os.path.join(backup_dir, "manifest.json")
+        self.lock_file = os.path.join(backup_dir, "manifest.lock")
+        self.leader_file = os.path.join(backup_dir, "backup.lock")
+        self._leader_lock = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the background backup thread (one per worker; only the lock holder backs up)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="backups", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            wait = self.interval
+            if self._become_leader():
+                try:
+                    latest = self.generations()[:1]
+                    age = time.time() - latest[0]['created_ts'] if latest else self.interval
+                    if age >= self.interval:
+                        self.take()
+                        age = 0
+                    wait = self.interval - age
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"License backup failed: {e}")
+            time.sleep(max(1.0, wait))
+
+    def _become_leader(self) -> bool:
+        """Only one worker takes the scheduled backups"""
+        if self._leader_lock is not None or fcntl is None:
+            return True
+        os.makedirs(self.backup_dir, exist_ok=True)
+        lock = open(self.leader_file, 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._leader_lock = lock  # held for the life of the worker
+        return True
+
+    def take(self) -> dict:
+        """
+        Save the current table as a new generation and rotate out the oldest
+        Returns its manifest entry (the latest one if the table hasn't changed since)
+        """
+        return self.save(*self.store.export())
+
+    def save(self, seq: int, licenses: dict) -> dict:
+        """Save a version of the table read elsewhere (see take). Returns its manifest entry."""
+        payload = json.dumps({"seq": seq, "licenses": licenses}, separators=(',', ':')).encode()
+        data = gzip.compress(payload, mtime=0)  # same table -> same bytes -> same checksum
+        checksum = hashlib.sha256(data).hexdigest()
+
+        with self._locked():
+            generations = self._read_manifest()
+            if generations and generations[0]['sha256'] == checksum:
+                return generations[0]
+
+            now = time.time()
+            name = f"licenses-{datetime.fromtimestamp(now):%Y%m%dT%H%M%S}-{seq}.json.gz"
+            path = os.path.join(self.backup_dir, name)
+            tmp_file = f"{path}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, path)
+
+            entry = {
+                "name": name,
+                "seq": seq,
+                "created_at": datetime.fromtimestamp(now).isoformat(),
+                "created_ts": now,
+                "licenses": len(licenses),
+                "bytes": len(data),
+                "sha256": checksum
+            }
+            generations.insert(0, entry)
+            for old in generations[self.keep:]:
+                try:
+                    os.remove(os.path.join(self.backup_dir, old['name']))
+                except OSError:
+                    pass
+            self._write_manifest(generations[:self.keep])
+
+        if self.logger:
+            self.logger.info(f"License backup {name} written ({len(licenses)} licenses, seq {seq})")
+        return entry
+
+    def generations(self) -> list:
+        """Manifest entries, newest first"""
+        with self._locked():
+            return self._read_manifest()
+
+    def verify(self, entry: dict) -> bool:
+        """True if a generation's file still matches its checksum"""
+        try:
+            with open(os.path.join(self.backup_dir, entry['name']), 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest() == entry['sha256']
+        except OSError:
+            return False
+
+    def load(self, name: str):
+        """
+        Read a generation back as (manifest entry, licenses)
+        Raises KeyError for an unknown generation and ValueError if its checksum doesn't match
+        """
+        entry = next((e for e in self.generations() if e['name'] == name), None)
+        if entry is None:
+            raise KeyError(name)
+        with open(os.path.join(self.backup_dir, name), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise ValueError(f"Backup {name} is corrupt (checksum mismatch)")
+        return entry, json.loads(gzip.decompress(data))['licenses']
+
+    def _read_manifest(self) -> list:
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _write_manifest(self, generations: list):
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(generations, f, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize manifest changes across gunicorn workers"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for License Server hot paths
+Times the server's own handlers (through the Flask test client) and building blocks across
+database sizes and compares against a saved baseline
+
+    python benchmark.py --save            # record benchmark_baseline.json
+    python benchmark.py                   # compare, exit 1 if anything regressed
+    python benchmark.py --threshold 0.5   # allow 50% slowdown before failing
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+SIZES = [100, 1000, 10000]
+MOD_SIZES = [64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_THRESHOLD = 0.25  # fail if 25% slower than baseline
+REPEATS = 7
+
+server = None  # license_server_advanced, imported inside a scratch directory
+
+
+def measure(func, min_time: float = 0.1) -> float:
+    """Best seconds per call of func over REPEATS timed batches (least affected by noise)"""
+    # Calibrate batch size so each batch runs at least min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+
+@contextmanager
+def unlimited():
+    """Lift the per-IP rate limit and download quotas so handlers can be timed back to back"""
+    from download_quota import DownloadQuota
+
+    is_rate_limited, download_quota = server.is_rate_limited, server.download_quota
+    server.is_rate_limited = lambda ip: False
+    server.download_quota = DownloadQuota(1e12, 1e12, 1e12, 1e12, 1 << 20, 1 << 20)
+    try:
+        yield
+    finally:
+        server.is_rate_limited, server.download_quota = is_rate_limited, download_quota
+
+
+def make_licenses(count: int) -> dict:
+    """Synthetic license table shaped like production records"""
+    now = "2024-01-01T12:00:00"
+    return {
+        f"{i:064x}": {
+            "license": f"{i:032X}",
+            "active": i % 10 != 0,
+            "registered_at": now,
+            "last_checked": now,
+            "status": "active" if i % 10 else "revoked",
+            "registrations": 1,
+            "last_user": f"Player{i}",
+            "last_ip": f"10.0.{(i >> 8) & 255}.{i & 255}",
+            "downloads": i % 7
+        }
+        for i in range(count)
+    }
+
+
+def use_database(size: int):
+    """Point the server at a fresh store holding `size` licenses"""
+    from license_store import LicenseStore
+
+    json_file = f"licenses_{size}.json"
+    with open(json_file, 'w') as f:
+        json.dump(make_licenses(size), f)
+    server.license_store = LicenseStore(json_file, server.LICENSE_JOURNAL_MAX_BYTES)
+    server.license_index_stale = True
+    return server.load_licenses()
+
+
+def bench_database(size: int) -> dict:
+    from license_store import LicenseStore
+
+    results = {}
+    licenses = use_database(size)
+    hwid = next(h for h, info in licenses.items() if info['active'])
+    json_file = server.license_store.json_file
+
+    def cold_load():
+        server.license_store = LicenseStore(json_file, server.LICENSE_JOURNAL_MAX_BYTES)
+        server.load_licenses()
+
+    results["load_licenses.cold"] = measure(cold_load)
+    results["load_licenses.warm"] = measure(server.load_licenses)
+
+    def save_one():
+        table = server.load_licenses()
+        table[hwid]['last_checked'] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        server.save_licenses(table, hwid)
+
+    results["save_licenses.one"] = measure(save_one)
+    results["save_licenses.full"] = measure(lambda: server.save_licenses(server.load_licenses()), min_time=0.2)
+
+    license_key = server.load_licenses()[hwid]['license']
+    client = server.app.test_client()
+
+    def request(path: str, body: dict):
+        response = client.post(path, json=body)
+        assert response.status_code == 200, f"{path} returned {response.status_code}"
+
+    with unlimited():
+        results["verify_license"] = measure(
+            lambda: request('/auth/verify', {"hwid": hwid, "license": license_key}))
+        results["validate_license"] = measure(
+            lambda: request('/auth/validate', {"hwid": hwid, "license_key": license_key, "username": "Bench"}))
+    return results
+
+
+def bench_rate_limiter() -> dict:
+    results = {}
+    ips = [f"10.1.{i >> 8}.{i & 255}" for i in range(4096)]
+    counter = [0]
+
+    def many_ips():
+        counter[0] += 1
+        server.is_rate_limited(ips[counter[0] % len(ips)])
+
+    server.rate_limit_storage.clear()
+    results["is_rate_limited.spread"] = measure(many_ips)
+    server.rate_limit_storage.clear()
+    results["is_rate_limited.hot_ip"] = measure(lambda: server.is_rate_limited("10.2.0.1"))
+    server.rate_limit_storage.clear()
+    return results
+
+
+def bench_download() -> dict:
+    """Full /mod/download requests, including the streamed (chunked base64) body"""
+    results = {}
+    licenses = use_database(SIZES[0])
+    hwid = next(h for h, info in licenses.items() if info['active'])
+    body = {"hwid": hwid, "license": licenses[hwid]['license']}
+    client = server.app.test_client()
+
+    def download():
+        response = client.post('/mod/download', json=body)
+        assert response.status_code == 200, f"/mod/download returned {response.status_code}"
+        response.get_data()
+
+    with unlimited():
+        for size in MOD_SIZES:
+            with open(server.OBFUSCATED_MOD_FILE, 'wb') as f:
+                f.write(os.urandom(size))
+            # Wait for the fingerprinted build so only cached downloads are timed
+            while client.post('/mod/download', json=body).status_code == 503:
+                time.sleep(0.1)
+            results[f"download_mod.{size // 1024}k"] = measure(download)
+    return results
+
+
+def run_all() -> dict:
+    results = {}
+    results["generate_license_key"] = measure(server.generate_license_key)
+    results.update(bench_rate_limiter())
+    results.update(bench_download())
+    for size in SIZES:
+        for name, seconds in bench_database(size).items():
+            results[f"{name}.{size}"] = seconds
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Names of benchmarks slower than baseline by more than threshold"""
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    print("-" * 76)
+    for name, seconds in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40} {'-':>12} {seconds * 1e6:>10.1f}us {'new':>8}")
+            continue
+        change = seconds / base - 1
+        flag = "  <-- REGRESSION" if change > threshold else ""
+        print(f"{name:<40} {base * 1e6:>10.1f}us {seconds * 1e6:>10.1f}us {change:>+7.0%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    global server
+
+    parser = argparse.ArgumentParser(description="License server microbenchmarks")
+    parser.add_argument("--save", action="store_true", help="Save results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown as a fraction (default 0.25 = 25%%)")
+    args = parser.parse_args()
+    baseline_file = os.path.abspath(args.baseline)
+
+    print("=" * 50)
+    print("VORTEX LICENSE SERVER BENCHMARKS")
+    print("=" * 50)
+
+    # Import the server inside a scratch directory so its log/database files stay out of the repo
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            import logging
+            import license_server_advanced
+            server = license_server_advanced
+            logging.disable(logging.CRITICAL)
+            results = run_all()
+        finally:
+            os.chdir(cwd)
+
+    if args.save:
+        with open(baseline_file, 'w') as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results
+            }, f, indent=2, sort_keys=True)
+        compare(results, {}, args.threshold)
+        print(f"\n✓ Baseline saved to {baseline_file}")
+        return
+
+    if not os.path.exists(baseline_file):
+        compare(results, {}, args.threshold)
+        print(f"\nNo baseline at {baseline_file} - run with --save first")
+        return
+
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)["results"]
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}:")
+        for name in regressions:
+            print(f"  - {name}")
+        sys.exit(1)
+
+    print(f"\n✓ No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,8 +26,12 @@ class Config:
     
     # ==================== CLIENT SETTINGS ====================
     
-    # URL of license server (change to your server address)
-    SERVER_URL = "http://localhost:5000"
+    # URLs of license servers (change to your server addresses)
+    # List several (e.g. primary + replicas) and the client fails over to the fastest healthy one
+    SERVER_URLS = ["http://localhost:5000"]
+    
+    # Single server URL (kept for older scripts - first of SERVER_URLS)
+    SERVER_URL = SERVER_URLS[0]
     
     # Command to launch Minecraft with mod
     GAME_LAUNCH_COMMAND = "./gradlew runClient"
@@ -0,0 +1,228 @@
+"""
+Download Quotas - Per-license and global bandwidth/concurrency limits for mod downloads
+Bandwidth is enforced while streaming with token buckets; concurrency and large backlogs are
+rejected up front with the number of seconds to wait before retrying.
+
+Concurrency limits are shared by all workers through flock'd slot files (a crashed worker's
+slots are freed by the OS). A license's token bucket travels with its slot: it is loaded from the
+slot directory when a download starts and saved back when it ends, so a license gets the same rate
+whichever worker serves it. The global bucket is per worker - give each worker its share of the rate.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows - single process dev server only
+    fcntl = None
+
+
+class TokenBucket:
+    """Bytes-per-second bucket that may go into debt; callers sleep off the debt"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount tokens, returns seconds to wait before using them"""
+        self.refill(now)
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Seconds until amount tokens would be available (without taking them)"""
+        self.refill(now)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+
+class DownloadLease:
+    """A running download's concurrency slots - release() once the download ends (idempotent)"""
+
+    def __init__(self, quota, key: str, slot_files: list):
+        self.quota = quota
+        self.key = key
+        self.slot_files = slot_files
+        self.released = False
+
+    def release(self):
+        with self.quota._lock:
+            if self.released:
+                return
+            self.released = True
+            self.quota._release(self.key)
+        for f in self.slot_files:
+            f.close()  # drops the flock
+
+
+class DownloadQuota:
+    def __init__(self, license_rate: float, license_burst: float, global_rate: float, global_burst: float,
+                 license_concurrency: int, global_concurrency: int, max_wait: float = 30.0,
+                 max_tracked: int = 10000, slot_dir: str = None):
+        """
+        Initialize download quotas
+
+        Args:
+            license_rate / license_burst: Bytes per second and burst size for each license
+            global_rate / global_burst: Bytes per second and burst size for all downloads together
+            license_concurrency / global_concurrency: Simultaneous downloads allowed
+            max_wait: Longest a download may be throttled for; larger backlogs are rejected
+            max_tracked: Most per-license buckets kept in memory (idle ones are dropped first)
+            slot_dir: Directory of lock files sharing the concurrency limits between worker
+                      processes (None = limits apply to this process only)
+        """
+        self.license_rate = license_rate
+        self.license_burst = license_burst
+        self.license_concurrency = license_concurrency
+        self.global_concurrency = global_concurrency
+        self.max_wait = max_wait
+        self.max_tracked = max_tracked
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._buckets = OrderedDict()  # license -> TokenBucket, least recently used first
+        self._active = {}              # license -> downloads in progress
+        self._active_total = 0
+        self._lock = threading.Lock()
+        self.slot_dir = slot_dir if fcntl is not None else None
+        if self.slot_dir:
+            os.makedirs(self.slot_dir, exist_ok=True)
+        self.rejected = 0
+
+    def _bucket(self, key: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.license_rate, self.license_burst)
+            self._evict()
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self):
+        """Drop least recently used buckets of licenses that aren't downloading"""
+        while len(self._buckets) > self.max_tracked:
+            for key in self._buckets:
+                if key not in self._active:
+                    del self._buckets[key]
+                    break
+            else:
+                break
+
+    def acquire(self, key: str, size: int):
+        """
+        Start a download of size bytes for license key
+        Returns (lease, 0) if it may start - call lease.release() when done -
+        else (None, seconds to wait before retrying)
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            slot_files = []
+            license_slot = self._slot_name(key)
+            if not self._take_slot(license_slot, self.license_concurrency, self._active.get(key, 0), slot_files):
+                retry_after = size / self.license_rate
+            elif not self._take_slot("global", self.global_concurrency, self._active_total, slot_files):
+                retry_after = size / self.global_bucket.rate
+            else:
+                if key not in self._active:
+                    self._load_bucket(license_slot, bucket, now)
+                backlog = max(bucket.wait_for(size, now), self.global_bucket.wait_for(size, now))
+                retry_after = backlog - self.max_wait if backlog > self.max_wait else 0
+
+            if retry_after:
+                for f in slot_files:
+                    f.close()
+                self.rejected += 1
+                return None, max(1, math.ceil(retry_after))
+
+            self._active[key] = self._active.get(key, 0) + 1
+            self._active_total += 1
+            return DownloadLease(self, key, slot_files), 0
+
+    def _take_slot(self, name: str, limit: int, local_count: int, slot_files: list) -> bool:
+        """Claim one of limit slots called name, shared across workers when slot_dir is set"""
+        if self.slot_dir is None:
+            return local_count < limit
+        for i in range(limit):
+            f = open(os.path.join(self.slot_dir, f"{name}.{i}"), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            slot_files.append(f)
+            return True
+        return False
+
+    @staticmethod
+    def _slot_name(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def _load_bucket(self, name: str, bucket: TokenBucket, now: float):
+        """Continue from the bucket the last download of this license left (in any worker)"""
+        if self.slot_dir is None:
+            return
+        try:
+            with open(os.path.join(self.slot_dir, f"{name}.bucket"), 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Saved with wall-clock time: monotonic clocks aren't comparable between processes
+        idle = max(0.0, time.time() - state['saved_at'])
+        bucket.tokens = min(bucket.burst, state['tokens'] + idle * bucket.rate)
+        bucket.updated = now
+
+    def _save_bucket(self, name: str, bucket: TokenBucket):
+        if self.slot_dir is None:
+            return
+        bucket.refill(time.monotonic())
+        path = os.path.join(self.slot_dir, f"{name}.bucket")
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({"tokens": bucket.tokens, "saved_at": time.time()}, f)
+            os.replace(tmp_file, path)
+        except OSError:
+            pass
+
+    def _release(self, key: str):
+        """Drop in-process counts for a finished download and hand its bucket on
+        (caller holds the lock; the license slot is still held)"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._save_bucket(self._slot_name(key), bucket)
+        self._active_total -= 1
+        remaining = self._active.get(key, 1) - 1
+        if remaining > 0:
+            self._active[key] = remaining
+        else:
+            self._active.pop(key, None)
+
+    def throttle(self, key: str, nbytes: int):
+        """Charge nbytes to the license and global buckets, sleeping if either is in debt"""
+        now = time.monotonic()
+        with self._lock:
+            wait = max(self._bucket(key, now).reserve(nbytes, now),
+                       self.global_bucket.reserve(nbytes, now))
+        if wait > 0:
+            time.sleep(wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active_total,
+                "licenses_downloading": len(self._active),
+                "tracked_licenses": len(self._buckets),
+                "rejected": self.rejected
+            }
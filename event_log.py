@@ -0,0 +1,259 @@
+"""
+Event Log - Structured activity events with hourly/daily rollups
+Handlers emit compact NDJSON events; a background thread writes them to a rotating
+log and folds them into per-hour and per-day counters for the analytics endpoint.
+
+Rollups are sharded into one file per day, so a flush only rewrites the current day.
+Per-license counts are kept in the daily counters only; hourly counters are totals.
+
+Event record keys:
+    t  - unix timestamp
+    e  - event type (register, verify, validate, download)
+    h  - HWID prefix (16 chars)
+    ok - whether the request succeeded
+    r  - failure reason (only when ok is false)
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows - single process dev server only
+    fcntl = None
+
+HOUR_FORMAT = "%Y-%m-%dT%H"
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def _new_counter(per_license: bool = True):
+    counter = {"total": 0, "failed": 0}
+    if per_license:
+        counter["licenses"] = {}
+    return counter
+
+
+class EventLog:
+    def __init__(self, log_file: str, rollup_dir: str, max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, flush_interval: float = 5.0,
+                 hourly_retention_days: int = 7, daily_retention_days: int = 90):
+        """
+        Initialize event log
+
+        Args:
+            log_file: NDJSON event log path (rotated at max_bytes, keeping backup_count files)
+            rollup_dir: Directory of per-day JSON files holding aggregated counters, shared by all workers
+            flush_interval: Seconds between writes of buffered events and rollups
+            hourly_retention_days / daily_retention_days: How long rollup buckets are kept
+        """
+        self.log_file = log_file
+        self.rollup_dir = rollup_dir
+        self.lock_file = os.path.join(rollup_dir, "rollups.lock")
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.hourly_retention = timedelta(days=hourly_retention_days)
+        self.daily_retention = timedelta(days=daily_retention_days)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def emit(self, event: str, hwid: str, ok: bool, reason: str = None):
+        """Record an event - never blocks the request on disk I/O"""
+        record = {"t": round(time.time(), 3), "e": event, "h": hwid[:16], "ok": ok}
+        if reason:
+            record["r"] = reason
+        self._queue.put(record)
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                # Started lazily so each gunicorn worker gets its own thread after fork
+                self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write buffered events to the log and fold them into the rollups"""
+        records = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not records:
+            return
+
+        deltas = self._aggregate(records)
+        lines = "".join(json.dumps(r, separators=(',', ':')) + "\n" for r in records)
+
+        with self._locked():
+            self._write_lines(lines)
+            for day, delta in deltas.items():
+                rollups = self._load_rollups(day)
+                self._merge(rollups, delta)
+                self._save_rollups(day, rollups)
+            self._prune()
+
+    @staticmethod
+    def _aggregate(records) -> dict:
+        """Count records into {day: {"day": {event: counter}, "hours": {hour: {event: counter}}}}"""
+        deltas = defaultdict(lambda: {"day": {}, "hours": defaultdict(dict)})
+        for record in records:
+            ts = datetime.fromtimestamp(record["t"])
+            delta = deltas[ts.strftime(DAY_FORMAT)]
+            day = delta["day"].setdefault(record["e"], _new_counter())
+            hour = delta["hours"][ts.strftime(HOUR_FORMAT)].setdefault(record["e"], _new_counter(False))
+            for counter in (day, hour):
+                counter["total"] += 1
+                if not record["ok"]:
+                    counter["failed"] += 1
+            day["licenses"][record["h"]] = day["licenses"].get(record["h"], 0) + 1
+        return deltas
+
+    @staticmethod
+    def _merge_counters(target: dict, events: dict, per_license: bool):
+        for event, counter in events.items():
+            merged = target.setdefault(event, _new_counter(per_license))
+            merged["total"] += counter["total"]
+            merged["failed"] += counter["failed"]
+            if per_license:
+                for hwid, count in counter["licenses"].items():
+                    merged["licenses"][hwid] = merged["licenses"].get(hwid, 0) + count
+
+    def _merge(self, rollups: dict, delta: dict):
+        self._merge_counters(rollups.setdefault("day", {}), delta["day"], True)
+        hours = rollups.setdefault("hours", {})
+        for hour, events in delta["hours"].items():
+            self._merge_counters(hours.setdefault(hour, {}), events, False)
+
+    def _prune(self):
+        """Delete day files past retention so the rollups stay bounded"""
+        cutoff = (datetime.now() - self.daily_retention).strftime(DAY_FORMAT)
+        for day in self._days():
+            if day < cutoff:
+                try:
+                    os.remove(self._rollup_path(day))
+                except OSError:
+                    pass
+
+    def _write_lines(self, lines: str):
+        if os.path.exists(self.log_file) and os.path.getsize(self.log_file) >= self.max_bytes:
+            self._rotate()
+        with open(self.log_file, 'a') as f:
+            f.write(lines)
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.log_file}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.log_file}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        else:
+            os.remove(self.log_file)
+
+    def _rollup_path(self, day: str) -> str:
+        return os.path.join(self.rollup_dir, f"{day}.json")
+
+    def _days(self) -> list:
+        """Days that have a rollup file, oldest first"""
+        try:
+            names = os.listdir(self.rollup_dir)
+        except OSError:
+            return []
+        return sorted(name[:-len(".json")] for name in names if name.endswith(".json"))
+
+    def _load_rollups(self, day: str) -> dict:
+        try:
+            with open(self._rollup_path(day), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"day": {}, "hours": {}}
+
+    def _save_rollups(self, day: str, rollups: dict):
+        path = self._rollup_path(day)
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(rollups, f, separators=(',', ':'))
+        os.replace(tmp_file, path)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize log/rollup writes across gunicorn workers"""
+        os.makedirs(self.rollup_dir, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def query(self, granularity: str = "day", event: str = None, hwid: str = None,
+              since: str = None, until: str = None) -> dict:
+        """
+        Read rollup counters
+
+        Args:
+            granularity: "hour" or "day"
+            event: Only this event type
+            hwid: Only counts for this HWID (prefix of up to 16 chars, daily granularity only)
+            since / until: Inclusive bucket bounds (e.g. "2024-01-31" or "2024-01-31T13")
+        """
+        if granularity not in ("hour", "day"):
+            raise ValueError("granularity must be 'hour' or 'day'")
+        if hwid and granularity != "day":
+            raise ValueError("per-license counts are only kept with granularity 'day'")
+        self.flush()
+        hwid = hwid[:16] if hwid else None
+        hour_cutoff = (datetime.now() - self.hourly_retention).strftime(HOUR_FORMAT)
+
+        result = {}
+        for day in self._days():
+            # Skip whole files outside the range without reading them
+            if since and day < since[:len(day)]:
+                continue
+            if until and day[:len(until)] > until:
+                continue
+            rollups = self._load_rollups(day)
+            if granularity == "day":
+                buckets = {day: rollups.get("day", {})}
+            else:
+                buckets = {h: e for h, e in rollups.get("hours", {}).items() if h >= hour_cutoff}
+
+            for bucket, events in sorted(buckets.items()):
+                if since and bucket < since:
+                    continue
+                if until and bucket[:len(until)] > until:
+                    continue
+                row = {}
+                for name, counter in events.items():
+                    if event and name != event:
+                        continue
+                    if hwid:
+                        count = counter["licenses"].get(hwid, 0)
+                        if count:
+                            row[name] = count
+                    else:
+                        row[name] = {"total": counter["total"], "failed": counter["failed"]}
+                        if "licenses" in counter:
+                            row[name]["licenses"] = len(counter["licenses"])
+                if row:
+                    result[bucket] = row
+        return result
@@ -0,0 +1,115 @@
+"""
+Expiry Scheduler - Min-heap of license expiry times
+A background thread sleeps until the earliest expiry and hands the due HWIDs to a callback,
+so expiring licenses costs O(expiring) work instead of a scan of the whole table.
+"""
+
+import heapq
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+
+def expiry_timestamp(info: dict) -> Optional[float]:
+    """Unix time a license expires at, or None if it doesn't (or is no longer active)"""
+    expires_at = info.get('expires_at')
+    if not expires_at or not info.get('active'):
+        return None
+    try:
+        return datetime.fromisoformat(expires_at).timestamp()
+    except ValueError:
+        return None
+
+
+def is_expired(info: dict) -> bool:
+    """True if the license is marked expired or its expiry has passed"""
+    if info.get('status') == 'expired':
+        return True
+    ts = expiry_timestamp(info)
+    return ts is not None and ts <= time.time()
+
+
+class ExpiryScheduler:
+    def __init__(self, on_expire: Callable[[List[str]], None], max_sleep: float = 60.0):
+        """
+        Initialize expiry scheduler
+
+        Args:
+            on_expire: Called with the list of HWIDs whose expiry has passed
+            max_sleep: Longest the thread sleeps before re-checking the heap
+        """
+        self.on_expire = on_expire
+        self.max_sleep = max_sleep
+        self._heap = []       # (expires_ts, hwid), may hold stale entries
+        self._current = {}    # hwid -> expires_ts that is still valid
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def rebuild(self, expiries):
+        """Schedule every license of a freshly loaded table from (hwid, expires_ts) pairs"""
+        with self._cond:
+            self._current = dict(expiries)
+            self._heap = [(ts, hwid) for hwid, ts in self._current.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        self._ensure_started()
+
+    def update(self, hwid: str, info: Optional[dict]):
+        """Reschedule one license after it changed (info=None if removed)"""
+        ts = expiry_timestamp(info) if info else None
+        with self._cond:
+            if ts is None:
+                # Stale heap entries are skipped when popped
+                self._current.pop(hwid, None)
+                return
+            if self._current.get(hwid) == ts:
+                return
+            self._current[hwid] = ts
+            heapq.heappush(self._heap, (ts, hwid))
+            self._cond.notify()
+        self._ensure_started()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._current)
+
+    def pop_due(self, now: float = None) -> List[str]:
+        """Remove and return HWIDs whose expiry is at or before now"""
+        now = time.time() if now is None else now
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                ts, hwid = heapq.heappop(self._heap)
+                if self._current.get(hwid) == ts:
+                    del self._current[hwid]
+                    due.append(hwid)
+        return due
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="expiry-scheduler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                timeout = self.max_sleep
+                if self._heap:
+                    timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+                if timeout > 0:
+                    self._cond.wait(timeout)
+            due = self.pop_due()
+            if due:
+                try:
+                    self.on_expire(due)
+                except Exception:
+                    # Put them back so the next pass retries
+                    with self._cond:
+                        for hwid in due:
+                            ts = time.time() + 1.0
+                            self._current[hwid] = ts
+                            heapq.heappush(self._heap, (ts, hwid))
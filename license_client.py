@@ -12,19 +12,156 @@ import platform
 import base64
 import subprocess
 import sys
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple, Union
+
+# Retry policy for overloaded (503) or rate limited (429) responses
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0   # seconds
+RETRY_MAX_DELAY = 15.0   # seconds
+
+# Multi-server failover
+CONNECT_TIMEOUT = 3.0        # seconds - fail over quickly when a server is down
+PROBE_TIMEOUT = 2.0          # seconds per /health probe
+ENDPOINT_CACHE_FILE = ".endpoints"
+ENDPOINT_CACHE_TTL = 3600    # seconds before cached probe results are re-checked up front
+CIRCUIT_FAILURES = 3         # consecutive failures that open an endpoint's circuit
+CIRCUIT_COOLDOWN = 30.0      # seconds before an open circuit lets a request through again
+MAX_REPLICA_LAG = 30.0       # seconds since a replica last had every change - further behind is unhealthy
+MAX_REPLICA_LAG_ENTRIES = 1000  # changes a replica may be missing before it is treated as unhealthy
+
+class EndpointPool:
+    def __init__(self, urls: List[str], cache_file: str = ENDPOINT_CACHE_FILE):
+        """
+        Track latency and health of several license servers
+        
+        Args:
+            urls: Base URLs of the license servers
+            cache_file: Where probe results are kept between launches
+        """
+        self.urls = [url.rstrip('/') for url in urls]
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.stats = {url: {"latency": None, "healthy": True, "checked_at": 0} for url in self.urls}
+        self.failures = {url: 0 for url in self.urls}
+        self.open_until = {url: 0.0 for url in self.urls}
+        
+        cache_age = self.load_cache()
+        if len(self.urls) > 1:
+            if cache_age is None or cache_age > ENDPOINT_CACHE_TTL:
+                self.probe()
+            else:
+                # Cached ranking is good enough to start with - refresh it in the background
+                threading.Thread(target=self.probe, daemon=True).start()
+    
+    def load_cache(self) -> Optional[float]:
+        """Load cached probe results, returns their age in seconds (None if unusable)"""
+        try:
+            with open(self.cache_file, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        checked = []
+        for url in self.urls:
+            if url in cached:
+                self.stats[url].update(cached[url])
+                checked.append(cached[url].get('checked_at', 0))
+        if len(checked) != len(self.urls):
+            return None
+        return time.time() - min(checked)
+    
+    def save_cache(self):
+        try:
+            with self.lock:
+                data = json.dumps(self.stats)
+            with open(self.cache_file, 'w') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"[!] Error saving endpoint cache: {e}")
+    
+    def probe_one(self, url: str):
+        start = time.perf_counter()
+        healthy = False
+        try:
+            response = requests.get(f"{url}/health", timeout=PROBE_TIMEOUT)
+            data = response.json() if response.status_code == 200 else {}
+            replication = data.get('replication') or {}
+            lag = replication.get('lag_seconds')
+            lag_entries = replication.get('lag_entries')
+            if replication.get('role') == 'replica':
+                # A replica with no lag reading has never caught up - its table may be empty or stale
+                healthy = (data.get('status') == 'ok'
+                           and lag is not None and lag <= MAX_REPLICA_LAG
+                           and lag_entries is not None and lag_entries <= MAX_REPLICA_LAG_ENTRIES)
+            else:
+                healthy = data.get('status') == 'ok'
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        latency = time.perf_counter() - start
+        
+        with self.lock:
+            self.stats[url] = {
+                "latency": latency if healthy else None,
+                "healthy": healthy,
+                "checked_at": time.time()
+            }
+            if healthy:
+                self.failures[url] = 0
+                self.open_until[url] = 0.0
+    
+    def probe(self):
+        """Check every server's /health in parallel"""
+        with ThreadPoolExecutor(max_workers=len(self.urls)) as pool:
+            list(pool.map(self.probe_one, self.urls))
+        self.save_cache()
+    
+    def ordered(self) -> List[str]:
+        """Servers to try, best first: healthy by latency, then unhealthy, then open circuits"""
+        now = time.time()
+        with self.lock:
+            def rank(url):
+                stat = self.stats[url]
+                circuit_open = self.open_until[url] > now
+                latency = stat['latency'] if stat['latency'] is not None else float('inf')
+                return (circuit_open, not stat['healthy'], latency)
+            return sorted(self.urls, key=rank)
+    
+    def record_success(self, url: str, latency: float):
+        with self.lock:
+            stat = self.stats[url]
+            previous = stat['latency']
+            # Smooth request latency into the probe latency
+            stat['latency'] = latency if previous is None else 0.7 * previous + 0.3 * latency
+            stat['healthy'] = True
+            self.failures[url] = 0
+            self.open_until[url] = 0.0
+    
+    def record_failure(self, url: str):
+        with self.lock:
+            self.failures[url] += 1
+            self.stats[url]['healthy'] = False
+            if self.failures[url] >= CIRCUIT_FAILURES:
+                self.open_until[url] = time.time() + CIRCUIT_COOLDOWN
+        self.save_cache()
 
 class LicenseClient:
-    def __init__(self, server_url: str, game_launch_command: str):
+    def __init__(self, server_url: Union[str, List[str]], game_launch_command: str):
         """
         Initialize license client
         
         Args:
-            server_url: URL of license server (e.g., 'http://your-server.com:5000')
+            server_url: URL of license server (e.g., 'http://your-server.com:5000'), or a list
+                        of URLs / comma separated string to fail over between
             game_launch_command: Command to launch Minecraft (e.g., ./gradlew runClient')
         """
-        self.server_url = server_url.rstrip('/')
+        if isinstance(server_url, str):
+            server_url = [url.strip() for url in server_url.split(',') if url.strip()]
+        self.endpoints = EndpointPool(server_url)
         self.game_launch_command = game_launch_command
         self.license_file = ".license"
         self.hwid = self.generate_hwid()
@@ -34,6 +171,11 @@ class LicenseClient:
         print(f"[*] Server: {self.server_url}")
         print(f"[*] HWID: {self.hwid[:16]}...")
     
+    @property
+    def server_url(self) -> str:
+        """Best server right now"""
+        return self.endpoints.ordered()[0]
+    
     @staticmethod
     def generate_hwid() -> str:
         """
@@ -57,6 +199,64 @@ class LicenseClient:
             # Fallback to random HWID
             return str(uuid.uuid4()).replace('-', '')
     
+    @staticmethod
+    def retry_delay(response: requests.Response, attempt: int) -> float:
+        """
+        Seconds to wait before retrying a shed request
+        Honors the server's Retry-After header, falling back to exponential backoff,
+        with jitter so clients don't all come back at the same moment
+        """
+        try:
+            delay = float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            delay = RETRY_BASE_DELAY * (2 ** attempt)
+        delay = min(delay, RETRY_MAX_DELAY)
+        return delay * random.uniform(0.5, 1.5)
+    
+    def _post(self, path: str, payload: dict, timeout: float) -> requests.Response:
+        """
+        POST to the fastest healthy license server
+        Fails over to the next server on connection errors or overload, and only backs off
+        once every server is shedding load
+        """
+        response = None
+        error = None
+        for attempt in range(MAX_RETRIES + 1):
+            delays = []
+            for url in self.endpoints.ordered():
+                start = time.perf_counter()
+                try:
+                    response = requests.post(
+                        f"{url}{path}",
+                        json=payload,
+                        timeout=(CONNECT_TIMEOUT, timeout)
+                    )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    error = e
+                    self.endpoints.record_failure(url)
+                    print(f"[!] Server {url} unreachable, trying next...")
+                    continue
+                
+                if response.status_code in (429, 503):
+                    delays.append(self.retry_delay(response, attempt))
+                    continue
+                if response.status_code >= 500:
+                    self.endpoints.record_failure(url)
+                    continue
+                
+                self.endpoints.record_success(url, time.perf_counter() - start)
+                return response
+            
+            if not delays or attempt == MAX_RETRIES:
+                break
+            delay = min(delays)
+            print(f"[!] Server busy ({response.status_code}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+        
+        if response is None:
+            raise error
+        return response
+    
     def load_local_license(self) -> bool:
         """
         Load license from local cache file
@@ -99,12 +299,16 @@ class LicenseClient:
         try:
             print("\n[*] Registering with license server...")
             
-            response = requests.post(
-                f"{self.server_url}/auth/register",
-                json={"hwid": self.hwid},
+            response = self._post(
+                "/auth/register",
+                {"hwid": self.hwid},
                 timeout=10
             )
             
+            if response.status_code == 403:
+                print("[X] License expired - contact the seller to renew")
+                return False
+            
             if response.status_code != 200:
                 print(f"[ERROR] Registration failed: {response.status_code}")
                 return False
@@ -146,9 +350,9 @@ class LicenseClient:
         try:
             print("\n[*] Verifying license with server...")
             
-            response = requests.post(
-                f"{self.server_url}/auth/verify",
-                json={
+            response = self._post(
+                "/auth/verify",
+                {
                     "hwid": self.hwid,
                     "license": self.license_key
                 },
@@ -167,7 +371,10 @@ class LicenseClient:
             
             if not data.get('authorized'):
                 reason = data.get('reason', 'unknown')
-                print(f"[X] License NOT authorized: {reason}")
+                if reason == 'expired':
+                    print(f"[X] License expired ({data.get('expires_at')}) - renew to keep playing")
+                else:
+                    print(f"[X] License NOT authorized: {reason}")
                 return False
             
             print("[+] License verified and authorized!")
@@ -192,9 +399,9 @@ class LicenseClient:
         try:
             print(f"\n[*] Downloading obfuscated mod...")
             
-            response = requests.post(
-                f"{self.server_url}/mod/download",
-                json={
+            response = self._post(
+                "/mod/download",
+                {
                     "hwid": self.hwid,
                     "license": self.license_key
                 },
@@ -284,12 +491,12 @@ def main():
     Example usage:
     python license_client.py
     """
-    # Configuration - change these to your server and launch command
-    SERVER_URL = "http://localhost:5000"  # Change to your server URL
+    # Configuration - change these to your server(s) and launch command
+    SERVER_URLS = ["http://localhost:5000"]  # Change to your server URL(s) - list several for failover
     GAME_LAUNCH_COMMAND = "./gradlew runClient"  # Or your game launch command
     
     # Create client and authenticate
-    client = LicenseClient(SERVER_URL, GAME_LAUNCH_COMMAND)
+    client = LicenseClient(SERVER_URLS, GAME_LAUNCH_COMMAND)
     
     # Run full authentication and launch flow
     success = client.inject_and_launch()
@@ -0,0 +1,74 @@
+"""
+License Index - Secondary indexes over the license table
+Lets admin lookups find a license by key, last IP or HWID prefix without scanning every record.
+"""
+
+from bisect import bisect_left, insort
+from typing import List, Optional
+
+
+class LicenseIndex:
+    def __init__(self):
+        self.by_key = {}        # license key -> hwid
+        self.by_ip = {}         # last_ip -> set of hwids
+        self.sorted_hwids = []  # sorted for prefix range scans
+        self._indexed = {}      # hwid -> (license key, last_ip) currently indexed
+
+    def rebuild(self, licenses: dict):
+        """Index a whole license table from scratch"""
+        self.by_key = {}
+        self.by_ip = {}
+        self._indexed = {}
+        self.sorted_hwids = sorted(licenses)
+        for hwid, info in licenses.items():
+            self._add_fields(hwid, info)
+
+    def update(self, hwid: str, info: Optional[dict]):
+        """Re-index one license after it was added, changed or (info=None) removed"""
+        if hwid in self._indexed:
+            self._remove_fields(hwid)
+        elif info is not None:
+            insort(self.sorted_hwids, hwid)
+
+        if info is None:
+            i = bisect_left(self.sorted_hwids, hwid)
+            if i < len(self.sorted_hwids) and self.sorted_hwids[i] == hwid:
+                del self.sorted_hwids[i]
+            return
+        self._add_fields(hwid, info)
+
+    def _add_fields(self, hwid: str, info: dict):
+        key = info.get('license')
+        ip = info.get('last_ip')
+        if key:
+            self.by_key[key] = hwid
+        if ip:
+            self.by_ip.setdefault(ip, set()).add(hwid)
+        self._indexed[hwid] = (key, ip)
+
+    def _remove_fields(self, hwid: str):
+        key, ip = self._indexed.pop(hwid)
+        if key and self.by_key.get(key) == hwid:
+            del self.by_key[key]
+        if ip and ip in self.by_ip:
+            self.by_ip[ip].discard(hwid)
+            if not self.by_ip[ip]:
+                del self.by_ip[ip]
+
+    def find_by_key(self, license_key: str) -> Optional[str]:
+        return self.by_key.get(license_key)
+
+    def find_by_ip(self, ip: str) -> List[str]:
+        return sorted(self.by_ip.get(ip, ()))
+
+    def find_by_prefix(self, prefix: str, limit: int = 100) -> List[str]:
+        """HWIDs starting with prefix, in O(log n + matches)"""
+        matches = []
+        i = bisect_left(self.sorted_hwids, prefix)
+        while i < len(self.sorted_hwids) and len(matches) < limit:
+            hwid = self.sorted_hwids[i]
+            if not hwid.startswith(prefix):
+                break
+            matches.append(hwid)
+            i += 1
+        return matches
@@ -3,7 +3,7 @@ Advanced License Server - With rate limiting, logging, and admin features
 Recommended for production use
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, g, Response, redirect
 from flask_cors import CORS
 import json
 import os
@@ -14,13 +14,28 @@ import base64
 import logging
 from collections import defaultdict
 import threading
+from admission import AdmissionController
+from event_log import EventLog
+from profiler import RequestProfiler
+from license_index import LicenseIndex
+from license_store import LicenseStore
+from replication import Replicator
+from backups import BackupManager
+from download_quota import DownloadQuota
+from mod_builds import ModBuilder, fingerprint_for
+from expiry import ExpiryScheduler, is_expired
+
+# Everything the server writes (licenses, journal, backups, events, builds, log) lives under
+# DATA_DIR. Each instance - primary or replica - needs its own, e.g. DATA_DIR=replica
+DATA_DIR = os.environ.get('DATA_DIR', '.')
+os.makedirs(DATA_DIR, exist_ok=True)
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='[%(asctime)s] [%(levelname)s] %(message)s',
     handlers=[
-        logging.FileHandler('license_server.log'),
+        logging.FileHandler(os.path.join(DATA_DIR, 'license_server.log')),
         logging.StreamHandler()
     ]
 )
@@ -30,10 +45,22 @@ app = Flask(__name__)
 CORS(app)
 
 # Configuration
-LICENSES_FILE = "licenses.json"
+LICENSES_FILE = os.path.join(DATA_DIR, "licenses.json")
 OBFUSCATED_MOD_FILE = "obfuscated_mod.jar"
 SERVER_SECRET = "your-secret-key-change-this"
 
+# Lifetime of self-registered licenses in seconds (None = never expire, e.g. 7*24*3600 for trials)
+DEFAULT_LICENSE_DURATION = None
+
+# Structured activity events (NDJSON) and their hourly/daily rollups
+EVENT_LOG_FILE = os.path.join(DATA_DIR, "events.ndjson")
+EVENT_ROLLUP_DIR = os.path.join(DATA_DIR, "event_rollups")  # one rollup file per day
+events = EventLog(EVENT_LOG_FILE, EVENT_ROLLUP_DIR)
+
+# On-demand request profiling (see /admin/profile)
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+profiler = RequestProfiler(PROFILE_DIR)
+
 # Rate limiting
 RATE_LIMIT_REQUESTS = 10  # requests
 RATE_LIMIT_WINDOW = 60    # seconds
@@ -60,34 +87,216 @@ def is_rate_limited(ip: str) -> bool:
         rate_limit_storage[ip].append(now)
         return False
 
+# Admission control (per worker process)
+# Requests can only queue for a slot (and be shed with a 503) while every slot is busy and spare
+# threads remain, so slots are derived from the gunicorn thread count (WEB_THREADS, see Procfile)
+# and kept well below it. Half the threads may wait in the priority queue; the rest stay free so a
+# new verify can still arrive and displace a queued lower priority request when the queue is full.
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 32))
+MAX_CONCURRENT_REQUESTS = max(1, WEB_THREADS // 4)
+MAX_QUEUED_REQUESTS = max(1, WEB_THREADS // 2)
+# route -> (priority, deadline seconds); lower priority value wins a free slot
+ROUTE_PRIORITIES = {
+    '/auth/verify': (0, 3.0),
+    '/auth/validate': (0, 3.0),
+    '/auth/register': (1, 3.0),
+    '/mod/download': (2, 5.0),
+    '/admin/licenses': (3, 1.0),
+}
+DEFAULT_ROUTE_PRIORITY = (2, 2.0)
+admission = AdmissionController(MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS)
+
+# Fingerprinted per-license mod builds
+MOD_BUILD_DIR = os.path.join(DATA_DIR, "mod_builds")
+MOD_BUILD_CACHE_BYTES = 2 * 1024 ** 3  # evict least recently downloaded builds past this
+MOD_BUILD_WORKERS = 2                  # build processes per server worker
+MOD_BUILD_WAIT = 1.0                   # seconds a download waits for an uncached build (holds a thread)
+mod_builder = ModBuilder(OBFUSCATED_MOD_FILE, MOD_BUILD_DIR, SERVER_SECRET,
+                         MOD_BUILD_CACHE_BYTES, MOD_BUILD_WORKERS)
+
+# Mod download quotas (per server instance; replicas each have their own)
+# Concurrency and each license's token bucket are shared by all workers through DOWNLOAD_SLOT_DIR,
+# so a license gets its rate whichever worker serves it. The global bucket is per worker, so every
+# worker gets an equal share of the instance-wide rate.
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 4))  # gunicorn -w, see Procfile
+DOWNLOAD_LICENSE_BYTES_PER_SEC = 1024 * 1024      # per license
+DOWNLOAD_LICENSE_BURST = 16 * 1024 * 1024
+DOWNLOAD_GLOBAL_BYTES_PER_SEC = 50 * 1024 * 1024  # all licenses together
+DOWNLOAD_GLOBAL_BURST = 64 * 1024 * 1024
+DOWNLOAD_LICENSE_CONCURRENCY = 1
+# Streaming downloads hold a thread after their admission slot is released. This caps the whole
+# instance (all WEB_WORKERS together) at WEB_THREADS // 4 downloads, so even if they all land on one
+# worker, three quarters of its threads stay free for the admission slots and queue (verify first)
+DOWNLOAD_GLOBAL_CONCURRENCY = max(1, WEB_THREADS // 4)
+DOWNLOAD_MAX_THROTTLE = 30.0   # seconds; larger backlogs get 429 + Retry-After
+DOWNLOAD_CHUNK_SIZE = 48 * 1024  # raw bytes per streamed chunk (multiple of 3 for base64)
+DOWNLOAD_SLOT_DIR = os.path.join(DATA_DIR, "download_slots")
+download_quota = DownloadQuota(
+    DOWNLOAD_LICENSE_BYTES_PER_SEC, DOWNLOAD_LICENSE_BURST,
+    DOWNLOAD_GLOBAL_BYTES_PER_SEC / WEB_WORKERS, DOWNLOAD_GLOBAL_BURST / WEB_WORKERS,
+    DOWNLOAD_LICENSE_CONCURRENCY, DOWNLOAD_GLOBAL_CONCURRENCY,
+    max_wait=DOWNLOAD_MAX_THROTTLE, slot_dir=DOWNLOAD_SLOT_DIR
+)
+
+# License table: mmap'd snapshot shared by all workers with a change journal on top
+LICENSE_JOURNAL_MAX_BYTES = 16 * 1024 * 1024  # compact into a new snapshot (in the background) past this
+LICENSE_JOURNAL_KEEP = 5000   # entries kept across a compaction so workers and replicas read on from them
+ACTIVITY_JOURNAL_INTERVAL = 300  # seconds; a license's last_checked alone is journaled at most this often
+license_store = LicenseStore(LICENSES_FILE, LICENSE_JOURNAL_MAX_BYTES, LICENSE_JOURNAL_KEEP, logger=logger)
+license_index = LicenseIndex()
+license_index_stale = True  # rebuilt on first admin lookup, not at startup
+licenses_lock = threading.RLock()
+
+# Point-in-time backups of the license table, taken off the request path
+BACKUP_DIR = os.path.join(DATA_DIR, "backups")
+BACKUP_KEEP = 24           # generations kept
+BACKUP_INTERVAL = 3600.0   # seconds between scheduled backups
+backups = BackupManager(license_store, BACKUP_DIR, BACKUP_KEEP, BACKUP_INTERVAL, logger=logger)
+
+# Replication: one primary takes writes, replicas follow its change stream and serve reads
+# Start a replica with REPLICATION_ROLE=replica PRIMARY_URL=http://primary:5000
+REPLICATION_ROLE = os.environ.get('REPLICATION_ROLE', 'primary')
+PRIMARY_URL = os.environ.get('PRIMARY_URL', '')
+REPLICATION_POLL_INTERVAL = 1.0  # seconds
+WRITE_ROUTES = {'/auth/register', '/admin/revoke', '/admin/reactivate', '/admin/expiry',
+                '/admin/backups/restore', '/admin/import'}
+
+def reindex_licenses(licenses, changed):
+    """Keep secondary indexes and the expiry schedule in step with the table"""
+    global license_index_stale
+    if changed is None:
+        license_index_stale = True
+        expiry_scheduler.rebuild(licenses.expiries())
+        return
+    for hwid in changed:
+        info = licenses.get(hwid)
+        if not license_index_stale:
+            license_index.update(hwid, info)
+        expiry_scheduler.update(hwid, info)
+
+def get_license_index(licenses) -> LicenseIndex:
+    """Secondary indexes, built on first use"""
+    global license_index_stale
+    with licenses_lock:
+        if license_index_stale:
+            license_index.rebuild(licenses)
+            license_index_stale = False
+        return license_index
+
 def load_licenses():
-    """Load or create licenses database"""
-    if os.path.exists(LICENSES_FILE):
+    """Load or create licenses database
+    Returns the shared table - callers that mutate it must call save_licenses"""
+    with licenses_lock:
         try:
-            with open(LICENSES_FILE, 'r') as f:
-                return json.load(f)
+            licenses, changed = license_store.refresh()
         except Exception as e:
             logger.error(f"Failed to load licenses: {e}")
             return {}
-    return {}
+        reindex_licenses(licenses, changed)
+        return licenses
 
-def save_licenses(licenses):
-    """Save licenses to file with backup"""
+def save_licenses(licenses, *changed_hwids):
+    """Save licenses - journals changed_hwids, or rewrites the whole table without them"""
+    if REPLICATION_ROLE == 'replica':
+        # The primary's change stream is the only writer on a replica;
+        # activity fields (last_checked, downloads) are only tracked by the primary
+        return
     try:
-        # Create backup
-        if os.path.exists(LICENSES_FILE):
-            backup_file = f"{LICENSES_FILE}.backup"
-            with open(LICENSES_FILE, 'r') as f:
-                backup_data = f.read()
-            with open(backup_file, 'w') as f:
-                f.write(backup_data)
-        
-        # Save new data
-        with open(LICENSES_FILE, 'w') as f:
-            json.dump(licenses, f, indent=2)
+        with licenses_lock:
+            if changed_hwids:
+                licenses, changed = license_store.commit(licenses, changed_hwids)
+            else:
+                licenses, changed = license_store.replace_all(licenses)
+            reindex_licenses(licenses, changed)
     except Exception as e:
         logger.error(f"Failed to save licenses: {e}")
 
+def record_activity(licenses, hwid, **fields):
+    """Stamp last_checked (and any other activity fields) on a verified license
+    Journaled only when a field other than last_checked changed or the stored last_checked is
+    ACTIVITY_JOURNAL_INTERVAL old - journaling every verify would keep the journal compacting."""
+    info = licenses[hwid]
+    now = datetime.now()
+    try:
+        fresh = (now - datetime.fromisoformat(info['last_checked'])).total_seconds() < ACTIVITY_JOURNAL_INTERVAL
+    except (KeyError, TypeError, ValueError):
+        fresh = False
+    if fresh and all(info.get(field) == value for field, value in fields.items()):
+        return
+    info['last_checked'] = now.isoformat()
+    info.update(fields)
+    save_licenses(licenses, hwid)
+
+def expire_licenses(hwids):
+    """Flip licenses whose expiry has passed to 'expired' (called by the expiry scheduler)"""
+    if REPLICATION_ROLE == 'replica':
+        return  # the primary expires licenses and replicates the change
+    
+    licenses = load_licenses()
+    expired = []
+    for hwid in hwids:
+        info = licenses.get(hwid)
+        if info and info.get('active') and is_expired(info):
+            info['active'] = False
+            info['status'] = 'expired'
+            info['expired_at'] = datetime.now().isoformat()
+            expired.append(hwid)
+    
+    if expired:
+        save_licenses(licenses, *expired)
+        for hwid in expired:
+            logger.info(f"License expired - HWID: {hwid[:16]}...")
+
+expiry_scheduler = ExpiryScheduler(expire_licenses)
+
+def on_replicated(licenses, changed):
+    """Re-index licenses changed by the replication stream"""
+    with licenses_lock:
+        reindex_licenses(licenses, changed)
+
+def claim_data_dir():
+    """Record which role owns DATA_DIR and refuse to start on another role's files
+    A replica resyncs by overwriting the snapshot and truncating the journal, so pointing one at
+    the primary's directory would silently wipe the primary's recent writes."""
+    role_file = f"{LICENSES_FILE}.role"
+    try:
+        with open(role_file, 'r') as f:
+            owner = f.read().strip()
+    except OSError:
+        owner = ''
+    if not owner:
+        with open(role_file, 'w') as f:
+            f.write(REPLICATION_ROLE)
+    elif owner != REPLICATION_ROLE:
+        raise RuntimeError(f"{os.path.abspath(DATA_DIR)} holds a {owner}'s license files; give the "
+                           f"{REPLICATION_ROLE} its own DATA_DIR (or delete {role_file} to repurpose it)")
+
+claim_data_dir()
+
+replicator = None
+if REPLICATION_ROLE == 'replica':
+    if not PRIMARY_URL:
+        raise RuntimeError("PRIMARY_URL must be set when REPLICATION_ROLE=replica")
+    replicator = Replicator(license_store, PRIMARY_URL, SERVER_SECRET, on_change=on_replicated,
+                            poll_interval=REPLICATION_POLL_INTERVAL, logger=logger)
+    # Follow the primary as soon as the worker starts. With gunicorn --preload this runs in the
+    # master, whose thread doesn't survive fork, so each forked worker resets and starts its own.
+    replicator.start()
+    os.register_at_fork(after_in_child=replicator.after_fork)
+
+def parse_expiry(data: dict):
+    """Expiry from a request body as an ISO timestamp
+    Accepts 'expires_at' (ISO) or 'expires_in' (seconds). Returns None if neither is given.
+    Raises ValueError for anything unparseable or out of range."""
+    if data.get('expires_at'):
+        return datetime.fromisoformat(str(data['expires_at'])).isoformat()
+    if data.get('expires_in') is not None:
+        try:
+            return (datetime.now() + timedelta(seconds=float(data['expires_in']))).isoformat()
+        except OverflowError:
+            raise ValueError("expires_in out of range")  # huge or infinite durations
+    return None
+
 def generate_license_key():
     """Generate cryptographically secure license key"""
     return secrets.token_hex(16).upper()
@@ -100,17 +309,64 @@ def get_client_ip() -> str:
         return request.environ.get('HTTP_X_FORWARDED_FOR').split(',')[0]
     return request.remote_addr
 
+@app.before_request
+def route_replica_request():
+    """On a replica, send writes to the primary"""
+    if replicator is None:
+        return
+    if request.path in WRITE_ROUTES:
+        # 307 keeps the method and body, so clients simply retry against the primary
+        return redirect(PRIMARY_URL.rstrip('/') + request.full_path.rstrip('?'), code=307)
+
+@app.before_request
+def start_backups():
+    """Start the scheduled backup thread on first request"""
+    backups.start()
+
 @app.before_request
 def check_rate_limit():
     """Check rate limiting before each request"""
-    if request.path.startswith('/admin'):
-        return  # Don't rate limit admin endpoints
+    if request.path.startswith(('/admin', '/replication')):
+        return  # Don't rate limit admin endpoints or replica polling
     
     ip = get_client_ip()
     if is_rate_limited(ip):
         logger.warning(f"Rate limit exceeded for IP: {ip}")
         return jsonify({"error": "Rate limited"}), 429
 
+@app.before_request
+def admit_request():
+    """Shed load with a fast 503 when a request can't start within its deadline"""
+    if request.path == '/health':
+        return
+    
+    priority, deadline = ROUTE_PRIORITIES.get(request.path, DEFAULT_ROUTE_PRIORITY)
+    if not admission.acquire(priority, deadline):
+        retry_after = admission.retry_after()
+        logger.warning(f"Overloaded - shed {request.path} (IP: {get_client_ip()})")
+        response = jsonify({"error": "Server overloaded", "retry_after": retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+    g.admitted = True
+
+@app.before_request
+def start_profiling():
+    """Profile this request if an admin profiling session samples it"""
+    if request.path.startswith('/admin/profile'):
+        return
+    profile = profiler.begin_request()
+    if profile is not None:
+        g.profile = profile
+
+@app.teardown_request
+def release_request(exc):
+    """Release the admission slot taken by admit_request"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.end_request(profile)
+    if g.pop('admitted', False):
+        admission.release()
+
 @app.route('/auth/register', methods=['POST'])
 def register_license():
     """Register new HWID and issue license"""
@@ -121,18 +377,37 @@ def register_license():
         if not hwid or len(hwid) < 16:
             return jsonify({"success": False, "error": "Invalid HWID"}), 400
         
+        # Only admins may choose the expiry (subscriptions, trial keys)
+        is_admin = request.args.get('password', '') == SERVER_SECRET
+        try:
+            expires_at = parse_expiry(data) if is_admin else None
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": "Invalid expiry"}), 400
+        if expires_at is None and DEFAULT_LICENSE_DURATION:
+            expires_at = (datetime.now() + timedelta(seconds=DEFAULT_LICENSE_DURATION)).isoformat()
+        
         licenses = load_licenses()
         ip = get_client_ip()
         
         # Check if already registered
         if hwid in licenses:
             license_info = licenses[hwid]
-            if license_info.get('active'):
+            if is_expired(license_info) and not is_admin:
+                logger.warning(f"Expired license re-registration attempt - HWID: {hwid[:16]}... (IP: {ip})")
+                events.emit("register", hwid, False, "expired")
+                return jsonify({"success": False, "error": "License expired"}), 403
+            
+            if license_info.get('active') and not is_expired(license_info):
+                if is_admin and expires_at:
+                    license_info['expires_at'] = expires_at
+                    save_licenses(licenses, hwid)
                 logger.info(f"License re-issued to HWID: {hwid[:16]}... (IP: {ip})")
+                events.emit("register", hwid, True)
                 return jsonify({
                     "success": True,
                     "license": license_info['license'],
-                    "registered": True
+                    "registered": True,
+                    "expires_at": license_info.get('expires_at')
                 }), 200
         
         # Generate new license
@@ -146,15 +421,19 @@ def register_license():
             "status": "active",
             "registrations": 1 if hwid not in licenses else licenses[hwid].get('registrations', 1) + 1
         }
+        if expires_at:
+            licenses[hwid]['expires_at'] = expires_at
         
-        save_licenses(licenses)
+        save_licenses(licenses, hwid)
         
         logger.info(f"New license registered - HWID: {hwid[:16]}... (IP: {ip})")
+        events.emit("register", hwid, True)
         
         return jsonify({
             "success": True,
             "license": license_key,
-            "registered": False
+            "registered": False,
+            "expires_at": expires_at
         }), 200
     
     except Exception as e:
@@ -177,28 +456,39 @@ def verify_license():
         
         if hwid not in licenses:
             logger.warning(f"Unknown HWID verification attempt: {hwid[:16]}... (IP: {ip})")
+            events.emit("verify", hwid, False, "not_registered")
             return jsonify({"success": True, "authorized": False, "reason": "not_registered"}), 200
         
         license_info = licenses[hwid]
         
         if license_info['license'] != license_key:
             logger.warning(f"Invalid license for HWID: {hwid[:16]}... (IP: {ip})")
+            events.emit("verify", hwid, False, "invalid_license")
             return jsonify({"success": True, "authorized": False, "reason": "invalid_license"}), 200
         
+        if is_expired(license_info):
+            logger.warning(f"Expired license for HWID: {hwid[:16]}... (IP: {ip})")
+            events.emit("verify", hwid, False, "expired")
+            return jsonify({"success": True, "authorized": False, "reason": "expired",
+                            "expires_at": license_info.get('expires_at')}), 200
+        
         if not license_info.get('active'):
             logger.warning(f"Inactive license for HWID: {hwid[:16]}... (IP: {ip})")
+            events.emit("verify", hwid, False, "inactive")
             return jsonify({"success": True, "authorized": False, "reason": "inactive"}), 200
         
         # Update last check
-        license_info['last_checked'] = datetime.now().isoformat()
-        save_licenses(licenses)
+        record_activity(licenses, hwid)
         
         logger.info(f"License verified - HWID: {hwid[:16]}... (IP: {ip})")
+        events.emit("verify", hwid, True)
+        mod_builder.prebuild(hwid, license_key)
         
         return jsonify({
             "success": True,
             "authorized": True,
-            "status": "active"
+            "status": "active",
+            "expires_at": license_info.get('expires_at')
         }), 200
     
     except Exception as e:
@@ -225,6 +515,7 @@ def validate_license():
         # Check if HWID exists
         if hwid not in licenses:
             logger.warning(f"Unknown HWID: {hwid[:16]}... from {username} ({ip})")
+            events.emit("validate", hwid, False, "not_registered")
             return jsonify({"valid": False, "error": "Not registered"}), 200
         
         license_info = licenses[hwid]
@@ -232,20 +523,27 @@ def validate_license():
         # Check license key matches
         if license_info.get('license') != license_key:
             logger.warning(f"Invalid license key for HWID {hwid[:16]}... from {username} ({ip})")
+            events.emit("validate", hwid, False, "invalid_license")
             return jsonify({"valid": False, "error": "Invalid license key"}), 200
         
+        # Check expiry
+        if is_expired(license_info):
+            logger.warning(f"Expired license for HWID {hwid[:16]}... from {username} ({ip})")
+            events.emit("validate", hwid, False, "expired")
+            return jsonify({"valid": False, "error": "License expired", "reason": "expired"}), 200
+        
         # Check if active
         if not license_info.get('active'):
             logger.warning(f"Inactive license for HWID {hwid[:16]}... from {username} ({ip})")
+            events.emit("validate", hwid, False, "inactive")
             return jsonify({"valid": False, "error": "License inactive"}), 200
         
         # Update activity
-        license_info['last_checked'] = datetime.now().isoformat()
-        license_info['last_user'] = username
-        license_info['last_ip'] = ip
-        save_licenses(licenses)
+        record_activity(licenses, hwid, last_user=username, last_ip=ip)
         
         logger.info(f"[{mode.upper()}] {username} authenticated from {ip}")
+        events.emit("validate", hwid, True)
+        mod_builder.prebuild(hwid, license_key)
         
         return jsonify({
             "valid": True,
@@ -259,6 +557,20 @@ def validate_license():
         logger.error(f"Validation error: {str(e)}")
         return jsonify({"valid": False, "error": "Server error"}), 500
 
+class ReleasingStream:
+    """Response body that releases a download lease when the server closes it"""
+    
+    def __init__(self, chunks, lease):
+        self.chunks = chunks
+        self.lease = lease
+    
+    def __iter__(self):
+        return iter(self.chunks)
+    
+    def close(self):
+        self.chunks.close()
+        self.lease.release()
+
 @app.route('/mod/download', methods=['POST'])
 def download_mod():
     """Download obfuscated mod code"""
@@ -277,33 +589,70 @@ def download_mod():
         # Verify authorization
         if (hwid not in licenses or 
             licenses[hwid]['license'] != license_key or 
-            not licenses[hwid].get('active')):
+            not licenses[hwid].get('active') or
+            is_expired(licenses[hwid])):
             logger.warning(f"Unauthorized mod download attempt - HWID: {hwid[:16]}... (IP: {ip})")
+            events.emit("download", hwid, False, "unauthorized")
             return jsonify({"success": False, "authorized": False}), 403
         
         if not os.path.exists(OBFUSCATED_MOD_FILE):
             logger.error(f"Mod file not found: {OBFUSCATED_MOD_FILE}")
             return jsonify({"success": False, "error": "Mod unavailable"}), 500
         
-        # Read mod file
-        with open(OBFUSCATED_MOD_FILE, 'rb') as f:
-            mod_data = f.read()
+        # Fingerprinted build for this license (normally prebuilt at verify time)
+        mod_data = None
+        mod_file = mod_builder.build(hwid, license_key, MOD_BUILD_WAIT)
+        if mod_file is not None:
+            try:
+                with open(mod_file, 'rb') as f:
+                    mod_data = f.read()
+            except FileNotFoundError:
+                mod_builder.submit(hwid, license_key)  # evicted after the lookup - build it again
         
-        mod_base64 = base64.b64encode(mod_data).decode('utf-8')
+        if mod_data is None:
+            logger.warning(f"Mod build not ready - HWID: {hwid[:16]}... (IP: {ip})")
+            response = jsonify({"success": False, "error": "Mod build in progress", "retry_after": 2})
+            response.headers['Retry-After'] = '2'
+            return response, 503
         
-        # Log download
-        licenses[hwid]['last_download'] = datetime.now().isoformat()
-        licenses[hwid]['downloads'] = licenses[hwid].get('downloads', 0) + 1
-        save_licenses(licenses)
+        # Same JSON document as before, streamed so quotas can throttle it
+        head = json.dumps({"success": True, "size": len(mod_data), "version": "1.0"})[:-1] + ', "mod": "'
+        tail = '"}'
+        encoded_size = 4 * ((len(mod_data) + 2) // 3)
         
-        logger.info(f"Mod downloaded - HWID: {hwid[:16]}... Size: {len(mod_data)} bytes (IP: {ip})")
+        def stream_mod():
+            yield head
+            for start in range(0, len(mod_data), DOWNLOAD_CHUNK_SIZE):
+                chunk = base64.b64encode(mod_data[start:start + DOWNLOAD_CHUNK_SIZE])
+                download_quota.throttle(hwid, len(chunk))
+                yield chunk
+            yield tail
         
-        return jsonify({
-            "success": True,
-            "mod": mod_base64,
-            "size": len(mod_data),
-            "version": "1.0"
-        }), 200
+        # Check download quotas
+        lease, retry_after = download_quota.acquire(hwid, encoded_size)
+        if lease is None:
+            logger.warning(f"Download quota exceeded - HWID: {hwid[:16]}... retry in {retry_after}s (IP: {ip})")
+            events.emit("download", hwid, False, "quota_exceeded")
+            response = jsonify({"success": False, "error": "Download quota exceeded", "retry_after": retry_after})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+        
+        try:
+            # Log download
+            licenses[hwid]['last_download'] = datetime.now().isoformat()
+            licenses[hwid]['downloads'] = licenses[hwid].get('downloads', 0) + 1
+            save_licenses(licenses, hwid)
+            
+            logger.info(f"Mod downloaded - HWID: {hwid[:16]}... Size: {len(mod_data)} bytes (IP: {ip})")
+            events.emit("download", hwid, True)
+            
+            # The WSGI server closes the body even if it is never iterated, which frees the slots
+            return Response(ReleasingStream(stream_mod(), lease), mimetype='application/json', headers={
+                "Content-Length": str(len(head) + encoded_size + len(tail))
+            }), 200
+        except Exception:
+            lease.release()
+            raise
     
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
@@ -323,6 +672,7 @@ def list_licenses():
         "total_licenses": len(licenses),
         "active": sum(1 for l in licenses.values() if l.get('active')),
         "inactive": sum(1 for l in licenses.values() if not l.get('active')),
+        "expired": sum(1 for l in licenses.values() if l.get('status') == 'expired'),
         "licenses": {}
     }
     
@@ -331,6 +681,7 @@ def list_licenses():
             "status": info.get('status'),
             "active": info.get('active'),
             "registered_at": info.get('registered_at'),
+            "expires_at": info.get('expires_at'),
             "last_checked": info.get('last_checked'),
             "last_download": info.get('last_download'),
             "downloads": info.get('downloads', 0),
@@ -354,6 +705,7 @@ def get_stats():
         "total_licenses": len(licenses),
         "active_licenses": sum(1 for l in licenses.values() if l.get('active')),
         "total_downloads": sum(l.get('downloads', 0) for l in licenses.values()),
+        "mod_builds": mod_builder.stats(),
         "recent_activity": []
     }
     
@@ -373,6 +725,311 @@ def get_stats():
     
     return jsonify(stats), 200
 
+@app.route('/admin/analytics', methods=['GET'])
+def get_analytics():
+    """Query hourly/daily activity rollups"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('hour', 'day'):
+        return jsonify({"error": "granularity must be 'hour' or 'day'"}), 400
+    
+    try:
+        rollups = events.query(
+            granularity=granularity,
+            event=request.args.get('event'),
+            hwid=request.args.get('hwid'),
+            since=request.args.get('since'),
+            until=request.args.get('until')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "granularity": granularity,
+        "buckets": rollups
+    }), 200
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_status():
+    """Current profiling session"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    return jsonify(profiler.status()), 200
+
+@app.route('/admin/profile/start', methods=['POST'])
+def start_profile():
+    """Profile a sample of requests for a bounded time window"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized profile attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    data = request.json or {}
+    try:
+        duration = float(data.get('duration', 30))
+        sample_rate = float(data.get('sample_rate', 1.0))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid duration or sample_rate"}), 400
+    
+    session = profiler.start(duration, sample_rate)
+    
+    logger.warning(f"Profiling started - session {session['session']} for {duration}s at rate {sample_rate}")
+    
+    return jsonify({"success": True, **session}), 200
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def stop_profile():
+    """End the profiling session early"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    session = profiler.stop()
+    
+    return jsonify({"success": True, "session": session.get('session')}), 200
+
+@app.route('/admin/profile/dump', methods=['GET'])
+def dump_profile():
+    """Merged profile of the last session: text, pstats or collapsed stacks"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    output_format = request.args.get('format', 'text')
+    
+    if output_format == 'pstats':
+        return Response(profiler.dump_pstats(), mimetype='application/octet-stream',
+                        headers={"Content-Disposition": "attachment; filename=profile.pstats"})
+    if output_format == 'collapsed':
+        return Response(profiler.dump_collapsed(), mimetype='text/plain')
+    if output_format == 'text':
+        return Response(profiler.dump_text(), mimetype='text/plain')
+    
+    return jsonify({"error": "format must be 'text', 'pstats' or 'collapsed'"}), 400
+
+def resolve_admin_hwid(data: dict, licenses) -> str:
+    """HWID an admin request refers to - given directly or by license key"""
+    hwid = data.get('hwid', '').strip()
+    license_key = data.get('license', '').strip()
+    if not hwid and license_key:
+        hwid = get_license_index(licenses).find_by_key(license_key) or ''
+    return hwid
+
+@app.route('/admin/lookup', methods=['GET'])
+def lookup_licenses():
+    """Find licenses by license key, last IP or HWID prefix"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized lookup attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    license_key = request.args.get('license', '').strip()
+    ip = request.args.get('ip', '').strip()
+    prefix = request.args.get('prefix', '').strip().rstrip('.')
+    
+    licenses = load_licenses()
+    index = get_license_index(licenses)
+    
+    if license_key:
+        hwid = index.find_by_key(license_key)
+        hwids = [hwid] if hwid else []
+    elif ip:
+        hwids = index.find_by_ip(ip)
+    elif prefix:
+        hwids = index.find_by_prefix(prefix)
+    else:
+        return jsonify({"error": "Provide license, ip or prefix"}), 400
+    
+    results = []
+    for hwid in hwids:
+        info = licenses[hwid]
+        results.append({
+            "hwid": hwid,
+            "status": info.get('status'),
+            "active": info.get('active'),
+            "registered_at": info.get('registered_at'),
+            "expires_at": info.get('expires_at'),
+            "last_checked": info.get('last_checked'),
+            "last_ip": info.get('last_ip'),
+            "downloads": info.get('downloads', 0)
+        })
+    
+    return jsonify({"count": len(results), "licenses": results}), 200
+
+@app.route('/admin/expiry', methods=['POST'])
+def set_license_expiry():
+    """Set or clear (no expires_at/expires_in) a license's expiry"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized expiry change attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    data = request.json or {}
+    try:
+        expires_at = parse_expiry(data)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid expiry"}), 400
+    
+    licenses = load_licenses()
+    hwid = resolve_admin_hwid(data, licenses)
+    
+    if hwid not in licenses:
+        return jsonify({"success": False, "error": "HWID not found"}), 404
+    
+    if expires_at:
+        licenses[hwid]['expires_at'] = expires_at
+    else:
+        licenses[hwid].pop('expires_at', None)
+    
+    save_licenses(licenses, hwid)
+    
+    logger.info(f"License expiry set - HWID: {hwid[:16]}... Expires: {expires_at or 'never'}")
+    
+    return jsonify({"success": True, "expires_at": expires_at}), 200
+
+@app.route('/admin/trace', methods=['POST'])
+def trace_fingerprint():
+    """Find the license a leaked jar's fingerprint belongs to"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized trace attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    data = request.json or {}
+    fingerprint = data.get('fingerprint', '').strip().lower()
+    if not fingerprint:
+        return jsonify({"success": False, "error": "Missing fingerprint"}), 400
+    
+    licenses = load_licenses()
+    
+    # Fingerprints are keyed HMACs, so tracing one means checking every license
+    for hwid, info in licenses.items():
+        if fingerprint_for(SERVER_SECRET, hwid, info.get('license', '')) == fingerprint:
+            logger.warning(f"Fingerprint traced - HWID: {hwid[:16]}...")
+            return jsonify({
+                "success": True,
+                "hwid": hwid,
+                "license": info.get('license'),
+                "status": info.get('status'),
+                "last_ip": info.get('last_ip'),
+                "last_user": info.get('last_user')
+            }), 200
+    
+    return jsonify({"success": False, "error": "Fingerprint not found"}), 404
+
+@app.route('/admin/backups', methods=['GET'])
+def list_backups():
+    """Backup generations, newest first (?verify=1 re-checks their checksums)"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    generations = backups.generations()
+    if request.args.get('verify'):
+        for entry in generations:
+            entry['valid'] = backups.verify(entry)
+    
+    return jsonify({"backups": generations}), 200
+
+@app.route('/admin/backups', methods=['POST'])
+def take_backup():
+    """Take a backup now"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized backup attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    entry = backups.take()
+    
+    return jsonify({"success": True, "backup": entry}), 200
+
+@app.route('/admin/backups/restore', methods=['POST'])
+def restore_backup():
+    """Replace the license table with a backup generation"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized restore attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    data = request.json or {}
+    name = data.get('name', '').strip()
+    
+    try:
+        entry, restored = backups.load(name)
+    except KeyError:
+        return jsonify({"success": False, "error": "Backup not found"}), 404
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({"success": False, "error": "Backup checksum mismatch"}), 409
+    
+    # Back up the table being replaced (under the store lock) so the restore itself can be undone
+    undo = {}
+    with licenses_lock:
+        licenses, changed = license_store.restore(
+            restored, keep=lambda seq, previous: undo.update(backups.save(seq, previous)))
+        reindex_licenses(licenses, changed)
+    
+    logger.warning(f"Licenses restored from backup {name} ({len(restored)} licenses, "
+                   f"previous state saved as {undo['name']})")
+    
+    return jsonify({"success": True, "restored": entry, "previous": undo}), 200
+
+@app.route('/admin/export', methods=['POST'])
+def export_licenses():
+    """Write the current table to licenses.json for editing by hand"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized export attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    seq = license_store.export_json()
+    
+    logger.info(f"Licenses exported to {LICENSES_FILE} at seq {seq}")
+    
+    return jsonify({"success": True, "file": LICENSES_FILE, "seq": seq}), 200
+
+@app.route('/admin/import', methods=['POST'])
+def import_licenses():
+    """Replace the license table with licenses.json (after editing it by hand)"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized import attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    undo = {}
+    try:
+        with licenses_lock:
+            licenses, changed = license_store.import_json(
+                keep=lambda seq, previous: undo.update(backups.save(seq, previous)))
+            reindex_licenses(licenses, changed)
+    except (OSError, ValueError) as e:
+        logger.error(f"License import failed: {e}")
+        return jsonify({"success": False, "error": f"Could not read {LICENSES_FILE}"}), 400
+    
+    logger.warning(f"Licenses imported from {LICENSES_FILE} ({len(licenses)} licenses, "
+                   f"previous state saved as {undo['name']})")
+    
+    return jsonify({"success": True, "licenses": len(licenses), "seq": license_store.seq,
+                    "previous": undo}), 200
+
 @app.route('/admin/revoke', methods=['POST'])
 def revoke_license():
     """Revoke a license"""
@@ -383,10 +1040,10 @@ def revoke_license():
         return jsonify({"error": "Unauthorized"}), 403
     
     data = request.json or {}
-    hwid = data.get('hwid', '').strip()
     reason = data.get('reason', 'admin_revoke')
     
     licenses = load_licenses()
+    hwid = resolve_admin_hwid(data, licenses)
     
     if hwid not in licenses:
         return jsonify({"success": False, "error": "HWID not found"}), 404
@@ -396,7 +1053,7 @@ def revoke_license():
     licenses[hwid]['revoked_at'] = datetime.now().isoformat()
     licenses[hwid]['revoke_reason'] = reason
     
-    save_licenses(licenses)
+    save_licenses(licenses, hwid)
     
     logger.warning(f"License revoked - HWID: {hwid[:16]}... Reason: {reason}")
     
@@ -411,32 +1068,87 @@ def reactivate_license():
         return jsonify({"error": "Unauthorized"}), 403
     
     data = request.json or {}
-    hwid = data.get('hwid', '').strip()
+    try:
+        expires_at = parse_expiry(data)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid expiry"}), 400
     
     licenses = load_licenses()
+    hwid = resolve_admin_hwid(data, licenses)
     
     if hwid not in licenses:
         return jsonify({"success": False, "error": "HWID not found"}), 404
     
     licenses[hwid]['active'] = True
     licenses[hwid]['status'] = 'active'
-    del licenses[hwid]['revoked_at']
-    del licenses[hwid]['revoke_reason']
+    licenses[hwid].pop('revoked_at', None)
+    licenses[hwid].pop('revoke_reason', None)
+    licenses[hwid].pop('expired_at', None)
+    if expires_at:
+        licenses[hwid]['expires_at'] = expires_at
+    elif is_expired(licenses[hwid]):
+        # Reactivating without a new expiry makes the license perpetual
+        licenses[hwid].pop('expires_at', None)
     
-    save_licenses(licenses)
+    save_licenses(licenses, hwid)
     
     logger.info(f"License reactivated - HWID: {hwid[:16]}...")
     
     return jsonify({"success": True, "message": "License reactivated"}), 200
 
+@app.route('/replication/changes', methods=['GET'])
+def replication_changes():
+    """Change stream for replicas: journal entries after ?since=<seq>"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized replication attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"error": "Invalid since"}), 400
+    
+    load_licenses()
+    head, changes = license_store.changes_since(since)
+    
+    if changes is None:
+        return jsonify({"head": head, "resync": True}), 200
+    return jsonify({"head": head, "changes": changes}), 200
+
+@app.route('/replication/snapshot', methods=['GET'])
+def replication_snapshot():
+    """Full copy of the license table for a replica (re)joining"""
+    password = request.args.get('password', '')
+    
+    if password != SERVER_SECRET:
+        logger.warning(f"Unauthorized replication attempt from IP: {get_client_ip()}")
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    load_licenses()
+    seq, licenses = license_store.export()
+    
+    logger.info(f"Replication snapshot sent at seq {seq} to {get_client_ip()}")
+    
+    return jsonify({"seq": seq, "licenses": licenses}), 200
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check"""
+    load_licenses()
+    replication = replicator.status() if replicator else {"role": "primary", "seq": license_store.seq}
+    # A replica that has never synced has an empty table - keep clients away until it has
+    synced = replication.get('synced', True)
+    
     return jsonify({
-        "status": "ok",
+        "status": "ok" if synced else "syncing",
         "server": "Advanced License Server v1.1",
-        "timestamp": datetime.now().isoformat()
-    }), 200
+        "timestamp": datetime.now().isoformat(),
+        "load": admission.snapshot(),
+        "downloads": download_quota.snapshot(),
+        "replication": replication
+    }), 200 if synced else 503
 
 @app.errorhandler(404)
 def not_found(e):
@@ -453,9 +1165,10 @@ if __name__ == '__main__':
     logger.info("="*60)
     logger.info(f"Licenses database: {LICENSES_FILE}")
     logger.info(f"Mod file: {OBFUSCATED_MOD_FILE}")
+    logger.info(f"Replication role: {REPLICATION_ROLE}" + (f" (primary: {PRIMARY_URL})" if replicator else ""))
     logger.info("IMPORTANT: Change SERVER_SECRET in production!")
     logger.info("="*60)
     
     # For production, use gunicorn instead:
-    # gunicorn -w 4 -b 0.0.0.0:5000 license_server_advanced:app
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # gunicorn -w 4 --threads 32 -b 0.0.0.0:5000 license_server_advanced:app
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False, threaded=True)
@@ -0,0 +1,622 @@
+"""
+License Store - Memory-mapped license snapshot with a change journal layered on top
+
+Files (next to the JSON database):
+    licenses.json.snap     - compact binary snapshot, mmap'd read-only and shared by all workers
+    licenses.json.journal  - NDJSON of records changed since the snapshot was written
+    licenses.json          - human readable export, written on first start and by export_json()
+                             (it lags the journal - never the source of truth)
+
+Snapshots are never modified in place and the journal is append-only, so a snapshot file plus a
+journal prefix is a fixed version of the table that can be read without holding the lock.
+
+Once the journal passes journal_max_bytes a background thread folds it into a new snapshot. The
+new journal starts with the last journal_keep entries already in that snapshot (replaying them is
+harmless - each holds a record's full value), so workers and replicas that had read any of them
+pick up where they left off instead of reloading the whole table.
+
+Snapshot layout (little endian):
+    header   magic 'VLS1', version, record count, hash slots, sequence number
+    records  fixed-width, sorted by HWID: hash, hwid offset/len, JSON offset/len, expiry
+    slots    open addressing hash table of record index + 1 (0 = empty)
+    heap     HWID bytes and per-record JSON
+
+Opening a snapshot is O(1); records are decoded only when read. An existing licenses.json is
+imported when the store is first created; later hand edits only take effect through import_json().
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+from expiry import expiry_timestamp
+
+try:
+    import fcntl
+except ImportError:  # Windows - single process dev server only
+    fcntl = None
+
+MAGIC = b'VLS1'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIQ')   # magic, version, count, slots, seq
+RECORD = struct.Struct('<QIHIId')   # hash, hwid_off, hwid_len, blob_off, blob_len, expires_ts
+SLOT = struct.Struct('<I')
+
+
+def hwid_hash(hwid: str) -> int:
+    """Stable 64-bit hash (the builtin hash() differs between worker processes)"""
+    return int.from_bytes(hashlib.blake2b(hwid.encode(), digest_size=8).digest(), 'little')
+
+
+def file_signature(path: str):
+    """(inode, mtime, size) of a file, or None if missing"""
+    try:
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+class Snapshot:
+    def __init__(self, path: str):
+        """Map a snapshot file read-only"""
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.slots, self.seq = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a license snapshot: {path}")
+        self._records_at = HEADER.size
+        self._slots_at = self._records_at + self.count * RECORD.size
+        self._heap_at = self._slots_at + self.slots * SLOT.size
+
+    @staticmethod
+    def write(path: str, licenses: dict, seq: int = 0):
+        """Write licenses as a snapshot (atomically replaces path)"""
+        hwids = sorted(licenses)
+        count = len(hwids)
+        slots = 8
+        while slots < count * 2:
+            slots *= 2
+
+        records = []
+        heap = bytearray()
+        table = [0] * slots
+        for i, hwid in enumerate(hwids):
+            info = licenses[hwid]
+            hwid_bytes = hwid.encode()
+            blob = json.dumps(info, separators=(',', ':')).encode()
+            h = hwid_hash(hwid)
+            records.append(RECORD.pack(
+                h, len(heap), len(hwid_bytes), len(heap) + len(hwid_bytes), len(blob),
+                expiry_timestamp(info) or 0.0
+            ))
+            heap += hwid_bytes
+            heap += blob
+
+            slot = h & (slots - 1)
+            while table[slot]:
+                slot = (slot + 1) & (slots - 1)
+            table[slot] = i + 1
+
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, count, slots, seq))
+            f.write(b''.join(records))
+            f.write(struct.pack(f'<{slots}I', *table))
+            f.write(heap)
+        os.replace(tmp_file, path)
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, i: int):
+        return RECORD.unpack_from(self._mm, self._records_at + i * RECORD.size)
+
+    def hwid_at(self, i: int) -> str:
+        _, off, length, _, _, _ = self._record(i)
+        start = self._heap_at + off
+        return self._mm[start:start + length].decode()
+
+    def info_at(self, i: int) -> dict:
+        _, _, _, off, length, _ = self._record(i)
+        start = self._heap_at + off
+        return json.loads(self._mm[start:start + length])
+
+    def expires_at(self, i: int) -> float:
+        return self._record(i)[5]
+
+    def find(self, hwid: str) -> int:
+        """Record index of hwid, or -1"""
+        h = hwid_hash(hwid)
+        hwid_bytes = hwid.encode()
+        slot = h & (self.slots - 1)
+        while True:
+            (entry,) = SLOT.unpack_from(self._mm, self._slots_at + slot * SLOT.size)
+            if not entry:
+                return -1
+            rec_hash, off, length, _, _, _ = self._record(entry - 1)
+            if rec_hash == h:
+                start = self._heap_at + off
+                if self._mm[start:start + length] == hwid_bytes:
+                    return entry - 1
+            slot = (slot + 1) & (self.slots - 1)
+
+
+class LicenseTable(MutableMapping):
+    """The license table: a read-only snapshot plus this worker's overlay of changed records
+    Records read from the snapshot are kept in the overlay so in-place edits stick until saved."""
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self._overlay = {}   # hwid -> info, or None if deleted
+        self._len = len(snapshot)
+
+    def __getitem__(self, hwid):
+        if hwid in self._overlay:
+            info = self._overlay[hwid]
+            if info is None:
+                raise KeyError(hwid)
+            return info
+        i = self.snapshot.find(hwid)
+        if i < 0:
+            raise KeyError(hwid)
+        info = self._overlay[hwid] = self.snapshot.info_at(i)
+        return info
+
+    def __contains__(self, hwid):
+        if hwid in self._overlay:
+            return self._overlay[hwid] is not None
+        return self.snapshot.find(hwid) >= 0
+
+    def __setitem__(self, hwid, info):
+        if hwid not in self:
+            self._len += 1
+        self._overlay[hwid] = info
+
+    def __delitem__(self, hwid):
+        if hwid not in self:
+            raise KeyError(hwid)
+        self._len -= 1
+        self._overlay[hwid] = None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for i in range(len(self.snapshot)):
+            hwid = self.snapshot.hwid_at(i)
+            if self._overlay.get(hwid, True) is not None:
+                yield hwid
+        for hwid, info in list(self._overlay.items()):
+            if info is not None and self.snapshot.find(hwid) < 0:
+                yield hwid
+
+    def items(self):
+        """(hwid, info) pairs - decodes snapshot records without caching them"""
+        for i in range(len(self.snapshot)):
+            hwid = self.snapshot.hwid_at(i)
+            if hwid in self._overlay:
+                if self._overlay[hwid] is not None:
+                    yield hwid, self._overlay[hwid]
+            else:
+                yield hwid, self.snapshot.info_at(i)
+        for hwid, info in list(self._overlay.items()):
+            if info is not None and self.snapshot.find(hwid) < 0:
+                yield hwid, info
+
+    def values(self):
+        for _, info in self.items():
+            yield info
+
+    def expiries(self):
+        """(hwid, expires_ts) of licenses that expire, read from fixed-width fields where possible"""
+        for i in range(len(self.snapshot)):
+            ts = self.snapshot.expires_at(i)
+            if ts:
+                hwid = self.snapshot.hwid_at(i)
+                if hwid not in self._overlay:
+                    yield hwid, ts
+        for hwid, info in list(self._overlay.items()):
+            ts = expiry_timestamp(info) if info is not None else None
+            if ts is not None:
+                yield hwid, ts
+
+
+class LicenseStore:
+    def __init__(self, json_file: str, journal_max_bytes: int = 16 * 1024 * 1024,
+                 journal_keep: int = 5000, logger=None):
+        """
+        Initialize license store
+
+        Args:
+            json_file: JSON license database (snapshot/journal/lock files live next to it)
+            journal_max_bytes: Journal size that triggers compaction into a new snapshot
+            journal_keep: Entries a compacted journal keeps from before its snapshot
+        """
+        self.json_file = json_file
+        self.snapshot_file = f"{json_file}.snap"
+        self.journal_file = f"{json_file}.journal"
+        self.lock_file = f"{json_file}.lock"
+        self.compact_lock_file = f"{json_file}.compact.lock"
+        self.journal_max_bytes = journal_max_bytes
+        self.journal_keep = journal_keep
+        self.logger = logger
+        self.table = None
+        self.seq = 0
+        self._snapshot_signature = None
+        self._journal_offset = 0
+        self._journal_start = None  # seq of the first journal entry
+        self._unreported = set()    # changes read by export/compaction, reported by the next refresh
+        self._compactor = None
+        # The table and journal offset are shared by this worker's threads; the flock only
+        # orders workers against each other, and shared holders would tail the journal twice
+        self._state_lock = threading.RLock()
+
+    # ==================== READ PATH ====================
+
+    def refresh(self):
+        """
+        Bring this worker's table up to date
+        Returns (table, changed hwids) - changed is None when the whole table was reloaded
+        """
+        self._ensure_created()
+        with self._locked(shared=True):
+            return self._catch_up()
+
+    def _ensure_created(self):
+        """First start: build the snapshot from licenses.json (if any) and export it"""
+        if file_signature(self.snapshot_file) is not None:
+            return
+        with self._locked():
+            if file_signature(self.snapshot_file) is None:
+                if os.path.exists(self.json_file):
+                    with open(self.json_file, 'r') as f:
+                        licenses = json.load(f)
+                else:
+                    licenses = {}
+                    self._write_json(licenses)
+                self._write_snapshot(licenses)
+
+    def _catch_up(self, report: bool = True):
+        """Read other workers' changes (caller holds the lock). Returns (table, changed) like
+        refresh(); with report=False the changes are held for the next call that reports them."""
+        signature = file_signature(self.snapshot_file)
+        if self.table is not None and signature == self._snapshot_signature:
+            changed = self._tail_journal()
+        else:
+            seen = self.seq if self.table is not None else None
+            self._open_snapshot(signature)
+            changed = self._tail_journal(seen)
+            # A compacted journal overlaps its snapshot; a worker that had read up to any of its
+            # entries only missed what follows. Anything else (first load, replace) is a reload.
+            start = self._journal_start
+            if seen is None or start is None or start > self.table.snapshot.seq or seen < start - 1:
+                changed = None
+
+        if self._unreported is None or changed is None:
+            changed = None
+        else:
+            changed |= self._unreported
+        if report:
+            self._unreported = set()
+            return self.table, changed
+        self._unreported = changed
+        return self.table, None
+
+    def _open_snapshot(self, signature):
+        # The old mapping is released once requests still using it drop their reference
+        snapshot = Snapshot(self.snapshot_file)
+        self.table = LicenseTable(snapshot)
+        self.seq = snapshot.seq
+        self._snapshot_signature = signature
+        self._journal_offset = 0
+        self._journal_start = None
+
+    def _tail_journal(self, since: int = None) -> set:
+        """Apply journal entries written since the last read
+        Returns the hwids of entries after since (default: all of them)"""
+        changed = set()
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except OSError:
+            return changed
+
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            if self._journal_start is None:
+                self._journal_start = entry['s']
+            self._apply(entry['h'], entry['v'])
+            # Entries kept from before the snapshot replay values it already holds
+            self.seq = max(self.seq, entry['s'])
+            if since is None or entry['s'] > since:
+                changed.add(entry['h'])
+        self._journal_offset += end
+        return changed
+
+    def _apply(self, hwid: str, info):
+        if info is None:
+            if hwid in self.table:
+                del self.table[hwid]
+        else:
+            self.table[hwid] = info
+
+    # ==================== WRITE PATH ====================
+
+    def commit(self, table, hwids):
+        """
+        Journal the current values of hwids from table (None/missing = deleted)
+        Returns (table, changed hwids) like refresh(), including other workers' changes
+        """
+        pending = {hwid: (table[hwid] if hwid in table else None) for hwid in hwids}
+
+        self._ensure_created()
+        with self._locked():
+            table, changed = self._catch_up()
+            lines = []
+            for hwid, info in pending.items():
+                self._apply(hwid, info)
+                self.seq += 1
+                lines.append(json.dumps({"s": self.seq, "h": hwid, "v": info}, separators=(',', ':')))
+            data = ("\n".join(lines) + "\n").encode()
+            with open(self.journal_file, 'ab') as f:
+                f.write(data)
+            if self._journal_start is None:
+                self._journal_start = self.seq - len(lines) + 1
+            self._journal_offset += len(data)
+
+            if changed is not None:
+                changed.update(pending)
+            if self._journal_offset >= self.journal_max_bytes:
+                self._compact_in_background()
+            return self.table, changed
+
+    def replace_all(self, licenses: dict):
+        """Replace the whole table (full rewrite of the snapshot)"""
+        licenses = dict(licenses.items())
+        self._ensure_created()
+        with self._locked():
+            self._catch_up()
+            self.seq += 1  # past every journaled entry, so replicas resync
+            self._write_snapshot(licenses)
+            return self._catch_up()
+
+    # ==================== CHANGE STREAM ====================
+
+    def changes_since(self, seq: int, limit: int = 1000):
+        """
+        Journal entries after seq, oldest first, as (head seq, entries)
+        entries is None when seq is older than the snapshot (compacted away) - resync from export()
+        """
+        self._ensure_created()
+        with self._locked(shared=True):
+            self._catch_up(report=False)
+            head = self.seq
+            oldest = self.table.snapshot.seq
+            if self._journal_start is not None:
+                oldest = min(oldest, self._journal_start - 1)
+            if seq < oldest or seq > head:
+                return head, None
+            try:
+                with open(self.journal_file, 'rb') as f:
+                    data = f.read(self._journal_offset)
+            except OSError:
+                data = b''
+
+        entries = []
+        for line in data.splitlines():
+            entry = json.loads(line)
+            if entry['s'] > seq:
+                entries.append(entry)
+                if len(entries) >= limit:
+                    break
+        return head, entries
+
+    def export(self):
+        """
+        Consistent copy of the whole table as (seq, licenses)
+        The lock is only held to pin a version; records are decoded after it is released.
+        """
+        self._ensure_created()
+        with self._locked(shared=True):
+            seq, snapshot, journal = self._pin()
+        return seq, self._materialize(snapshot, journal)
+
+    def _pin(self):
+        """A fixed version of the table as (seq, snapshot, journal bytes) (caller holds the lock)"""
+        self._catch_up(report=False)
+        snapshot = Snapshot(self.snapshot_file)
+        try:
+            with open(self.journal_file, 'rb') as f:
+                journal = f.read(self._journal_offset)
+        except OSError:
+            journal = b''
+        return self.seq, snapshot, journal
+
+    @staticmethod
+    def _materialize(snapshot: Snapshot, journal: bytes) -> dict:
+        """Decode a pinned version into a dict (closes the snapshot)"""
+        try:
+            licenses = {snapshot.hwid_at(i): snapshot.info_at(i) for i in range(len(snapshot))}
+        finally:
+            snapshot.close()
+        for line in journal.splitlines():
+            entry = json.loads(line)
+            if entry['v'] is None:
+                licenses.pop(entry['h'], None)
+            else:
+                licenses[entry['h']] = entry['v']
+        return licenses
+
+    def apply_changes(self, entries):
+        """Apply entries from another store's change stream, keeping their sequence numbers"""
+        self._ensure_created()
+        with self._locked():
+            table, changed = self._catch_up()
+            lines = []
+            for entry in entries:
+                if entry['s'] <= self.seq:
+                    continue
+                self._apply(entry['h'], entry['v'])
+                self.seq = entry['s']
+                lines.append(json.dumps(entry, separators=(',', ':')))
+                if changed is not None:
+                    changed.add(entry['h'])
+            if lines:
+                data = ("\n".join(lines) + "\n").encode()
+                with open(self.journal_file, 'ab') as f:
+                    f.write(data)
+                if self._journal_start is None:
+                    self._journal_start = json.loads(lines[0])['s']
+                self._journal_offset += len(data)
+            if self._journal_offset >= self.journal_max_bytes:
+                self._compact_in_background()
+            return self.table, changed
+
+    # ==================== COMPACTION ====================
+
+    def _compact_in_background(self):
+        """Start compacting unless this worker already is (caller holds the lock)"""
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self._run_compaction, name="compaction", daemon=True)
+            self._compactor.start()
+
+    def _run_compaction(self):
+        try:
+            self.compact()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"License journal compaction failed: {e}")
+
+    def compact(self) -> bool:
+        """
+        Fold the journal into a new snapshot. Returns False if there was nothing to do.
+        Decoding and writing the snapshot happen outside the store lock; only swapping the files
+        in holds it, so requests and commits carry on meanwhile.
+        """
+        if fcntl is None:
+            return self._compact()
+        with open(self.compact_lock_file, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False  # another worker is compacting
+            return self._compact()
+
+    def _compact(self) -> bool:
+        started = time.perf_counter()
+        with self._locked(shared=True):
+            seq, snapshot, journal = self._pin()
+            signature = self._snapshot_signature
+        if len(journal) < self.journal_max_bytes:
+            snapshot.close()
+            return False  # compacted by another worker since
+
+        next_file = f"{self.snapshot_file}.next"
+        Snapshot.write(next_file, self._materialize(snapshot, journal), seq)
+        kept = journal.splitlines(keepends=True)[-self.journal_keep:] if self.journal_keep else []
+
+        with self._locked():
+            self._catch_up(report=False)
+            if self._snapshot_signature != signature:
+                os.remove(next_file)  # the table was replaced meanwhile
+                return False
+            with open(self.journal_file, 'rb') as f:
+                f.seek(len(journal))
+                tail = f.read(self._journal_offset - len(journal))
+            tmp_file = f"{self.journal_file}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(b''.join(kept) + tail)
+            if os.name == 'nt':
+                # Windows can't replace a mapped file; elsewhere in-flight readers keep the old mapping
+                self.table.snapshot.close()
+            os.replace(next_file, self.snapshot_file)
+            os.replace(tmp_file, self.journal_file)
+            self._catch_up(report=False)
+
+        if self.logger:
+            self.logger.info(f"License journal compacted at seq {seq} ({len(journal)} bytes, "
+                             f"{time.perf_counter() - started:.2f}s)")
+        return True
+
+    def load_export(self, seq: int, licenses: dict):
+        """Replace the whole table with another store's export()"""
+        with self._locked():
+            self.seq = seq
+            self._write_snapshot(licenses)
+            return self._catch_up()
+
+    def export_json(self) -> int:
+        """Write the current table to licenses.json (e.g. before editing it by hand). Returns its seq."""
+        seq, licenses = self.export()
+        self._write_json(licenses)
+        return seq
+
+    def restore(self, licenses: dict, keep=None):
+        """
+        Replace the whole table, handing the table it replaces to keep(seq, licenses) first
+        Both happen under one exclusive lock, so no write can fall between them. If keep
+        raises, nothing is replaced. Returns (table, changed) like replace_all().
+        """
+        licenses = dict(licenses.items())
+        self._ensure_created()
+        with self._locked():
+            seq, snapshot, journal = self._pin()
+            previous = self._materialize(snapshot, journal)
+            if keep is not None:
+                keep(seq, previous)
+            self.seq += 1  # past every journaled entry, so replicas resync
+            self._write_snapshot(licenses)
+            return self._catch_up()
+
+    def import_json(self, json_file: str = None, keep=None):
+        """
+        Replace the whole table with a JSON file (default: licenses.json, e.g. after editing it by hand)
+        Changes journaled since that file was exported are lost - keep works as in restore()
+        """
+        with open(json_file or self.json_file, 'r') as f:
+            licenses = json.load(f)
+        return self.restore(licenses, keep)
+
+    def _write_json(self, licenses: dict):
+        tmp_file = f"{self.json_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(licenses, f, indent=2)
+        os.replace(tmp_file, self.json_file)
+
+    def _write_snapshot(self, licenses: dict):
+        """Replace the table: write a new snapshot and start an empty journal (caller holds the lock)"""
+        if self.table is not None and os.name == 'nt':
+            # Windows can't replace a mapped file; elsewhere in-flight readers keep the old mapping
+            self.table.snapshot.close()
+        self.table = None
+        Snapshot.write(self.snapshot_file, licenses, self.seq)
+        with open(self.journal_file, 'wb'):
+            pass
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        """Serialize snapshot/journal changes across gunicorn workers and this worker's threads"""
+        with self._state_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
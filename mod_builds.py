@@ -0,0 +1,209 @@
+"""
+Mod Builds - Per-license fingerprinted copies of the obfuscated mod
+Each licensee gets a jar stamped with a fingerprint so a leaked copy can be traced back.
+Stamping runs off the request path in child processes that run this file as a script, so they
+import nothing from the server; finished jars live in a size-bounded on-disk LRU cache keyed by
+(base build hash, license), shared by all workers.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+FINGERPRINT_ENTRY = "META-INF/vortex.fingerprint"
+FINGERPRINT_TRAILER = b"\nVORTEX-FP:"
+BUILD_SCRIPT = os.path.abspath(__file__)
+
+
+def fingerprint_for(secret: str, hwid: str, license_key: str) -> str:
+    """Fingerprint stamped into a license's build (HMAC, so it can't be forged without the secret)"""
+    return hmac.new(secret.encode(), f"{hwid}:{license_key}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def stamp_jar(base_file: str, out_file: str, fingerprint: str, base_hash: str):
+    """Copy base_file to out_file with the fingerprint embedded (runs in a build process)"""
+    tmp_file = f"{out_file}.{os.getpid()}.tmp"
+    if zipfile.is_zipfile(base_file):
+        stamp = json.dumps({"fingerprint": fingerprint, "build": base_hash})
+        with zipfile.ZipFile(base_file, 'r') as src, \
+                zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as dst:
+            for item in src.infolist():
+                if item.filename != FINGERPRINT_ENTRY:
+                    dst.writestr(item, src.read(item.filename))
+            dst.writestr(FINGERPRINT_ENTRY, stamp)
+            dst.comment = f"vortex:{fingerprint}".encode()
+    else:
+        # Not a zip - append a trailer instead
+        shutil.copyfile(base_file, tmp_file)
+        with open(tmp_file, 'ab') as f:
+            f.write(FINGERPRINT_TRAILER + fingerprint.encode())
+    os.replace(tmp_file, out_file)
+    return out_file
+
+
+def run_build(base_file: str, out_file: str, fingerprint: str, base_hash: str):
+    """Run stamp_jar in a child process (called on a pool thread)
+    Not a multiprocessing pool: spawned workers re-import the parent's __main__ - the server
+    script itself when run directly - and would rerun its startup (replication, backups...)."""
+    subprocess.run([sys.executable, BUILD_SCRIPT, base_file, out_file, fingerprint, base_hash],
+                   stdin=subprocess.DEVNULL, check=True)
+    return out_file
+
+
+def read_fingerprint(jar_file: str):
+    """Fingerprint stamped into a jar, or None"""
+    if zipfile.is_zipfile(jar_file):
+        with zipfile.ZipFile(jar_file, 'r') as jar:
+            if FINGERPRINT_ENTRY in jar.namelist():
+                return json.loads(jar.read(FINGERPRINT_ENTRY))["fingerprint"]
+            comment = jar.comment.decode(errors='ignore')
+            return comment[len("vortex:"):] if comment.startswith("vortex:") else None
+    with open(jar_file, 'rb') as f:
+        f.seek(max(0, os.path.getsize(jar_file) - 64))
+        tail = f.read()
+    i = tail.rfind(FINGERPRINT_TRAILER)
+    return tail[i + len(FINGERPRINT_TRAILER):].decode() if i >= 0 else None
+
+
+class ModBuilder:
+    def __init__(self, base_file: str, cache_dir: str, secret: str,
+                 max_cache_bytes: int = 2 * 1024 ** 3, workers: int = 2):
+        """
+        Initialize mod builder
+
+        Args:
+            base_file: The obfuscated mod every build starts from
+            cache_dir: Directory for finished builds
+            secret: Key for fingerprints
+            max_cache_bytes: Cache size; least recently downloaded builds are evicted past it
+            workers: Concurrent build processes per server worker
+        """
+        self.base_file = base_file
+        self.cache_dir = cache_dir
+        self.secret = secret
+        self.max_cache_bytes = max_cache_bytes
+        self.workers = workers
+        self._pool = None
+        self._pending = {}  # cache path -> Future
+        self._lock = threading.Lock()
+        self._base_signature = None
+        self._base_hash = None
+
+    def base_hash(self) -> str:
+        """SHA-256 of the base build, recomputed only when the file changes"""
+        stat = os.stat(self.base_file)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._base_signature:
+            digest = hashlib.sha256()
+            with open(self.base_file, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            self._base_hash = digest.hexdigest()
+            self._base_signature = signature
+        return self._base_hash
+
+    def cache_path(self, hwid: str, license_key: str) -> str:
+        license_id = hashlib.sha256(f"{hwid}:{license_key}".encode()).hexdigest()[:24]
+        return os.path.join(self.cache_dir, f"{self.base_hash()[:16]}-{license_id}.jar")
+
+    def get(self, hwid: str, license_key: str):
+        """Path of a finished build, or None if it isn't cached"""
+        path = self.cache_path(hwid, license_key)
+        try:
+            os.utime(path)  # mark as recently used for LRU eviction
+        except OSError:
+            return None
+        return path
+
+    def submit(self, hwid: str, license_key: str):
+        """Queue a build (no-op if cached or already building). Returns its Future or None."""
+        path = self.cache_path(hwid, license_key)
+        if os.path.exists(path):
+            return None
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            future = self._get_pool().submit(run_build, self.base_file, path,
+                                             fingerprint_for(self.secret, hwid, license_key),
+                                             self.base_hash())
+            self._pending[path] = future
+        future.add_done_callback(lambda f, path=path: self._finished(path))
+        return future
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            # Created lazily so each gunicorn worker gets its own pool after fork; each thread
+            # waits on a fresh build process (see run_build), so a crashed build only fails itself
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mod-build")
+        return self._pool
+
+    def build(self, hwid: str, license_key: str, timeout: float):
+        """Path of the build, waiting up to timeout for it. None if it isn't ready in time."""
+        path = self.get(hwid, license_key)
+        if path:
+            return path
+        future = self.submit(hwid, license_key)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except FutureTimeout:
+                return None
+        return self.get(hwid, license_key)
+
+    def prebuild(self, hwid: str, license_key: str):
+        """Build ahead of the download for a license that was just active"""
+        try:
+            self.submit(hwid, license_key)
+        except OSError:
+            pass  # base build missing - nothing to prebuild
+
+    def _finished(self, path: str):
+        with self._lock:
+            self._pending.pop(path, None)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used builds until the cache fits max_cache_bytes"""
+        try:
+            entries = []
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.jar'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        try:
+            with os.scandir(self.cache_dir) as it:
+                sizes = [e.stat().st_size for e in it if e.name.endswith('.jar')]
+        except OSError:
+            sizes = []
+        return {"cached_builds": len(sizes), "cache_bytes": sum(sizes), "building": pending}
+
+
+if __name__ == '__main__':
+    # Build process entry point (see run_build): base_file out_file fingerprint base_hash
+    stamp_jar(*sys.argv[1:5])
@@ -0,0 +1,231 @@
+"""
+Request Profiler - On-demand profiling of live requests
+An admin starts a session for a bounded time window and sample rate. Every worker picks
+it up from a shared control file, runs cProfile on sampled requests and samples their
+stacks, then writes its share to disk where dump() merges them across workers.
+
+Off by default - requests only pay a timestamp comparison until a session is started.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+CONTROL_FILE = "control.json"
+MAX_SESSION_SECONDS = 600
+
+
+class RequestProfiler:
+    def __init__(self, output_dir: str, check_interval: float = 1.0, sample_interval: float = 0.005):
+        """
+        Initialize request profiler
+
+        Args:
+            output_dir: Directory for the control file and per-worker dumps
+            check_interval: Seconds between checks of the control file
+            sample_interval: Seconds between stack samples of profiled requests
+        """
+        self.output_dir = output_dir
+        self.control_file = os.path.join(output_dir, CONTROL_FILE)
+        self.check_interval = check_interval
+        self.sample_interval = sample_interval
+        self._next_check = 0.0
+        self._session = None
+        self._until = 0.0
+        self._sample_rate = 0.0
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()  # one cProfile at a time per process
+        self._stats = None
+        self._stacks = Counter()
+        self._threads = set()
+        self._sampler = None
+
+    # ==================== ADMIN CONTROL ====================
+
+    def start(self, duration: float, sample_rate: float) -> dict:
+        """Start a profiling session for all workers"""
+        duration = max(1.0, min(float(duration), MAX_SESSION_SECONDS))
+        sample_rate = max(0.0, min(float(sample_rate), 1.0))
+        session = {
+            "session": uuid.uuid4().hex[:12],
+            "until": time.time() + duration,
+            "sample_rate": sample_rate
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name in os.listdir(self.output_dir):
+            if name.endswith((".pstats", ".collapsed")):
+                os.remove(os.path.join(self.output_dir, name))
+        self._write_control(session)
+        self._next_check = 0.0
+        return session
+
+    def stop(self) -> dict:
+        """End the current session early (dumps stay available)"""
+        session = self._read_control() or {}
+        if session:
+            session["until"] = 0
+            self._write_control(session)
+        self._next_check = 0.0
+        return session
+
+    def status(self) -> dict:
+        """Current session as seen by the control file"""
+        session = self._read_control() or {}
+        return {
+            "session": session.get("session"),
+            "active": session.get("until", 0) > time.time(),
+            "until": session.get("until"),
+            "sample_rate": session.get("sample_rate")
+        }
+
+    # ==================== REQUEST HOOKS ====================
+
+    def begin_request(self):
+        """Start profiling this request if a session is on and it is sampled"""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._refresh(now)
+        if not self._session or time.time() >= self._until:
+            return None
+        if random.random() >= self._sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+
+        profile = cProfile.Profile()
+        with self._lock:
+            self._threads.add(threading.get_ident())
+        profile.enable()
+        return profile
+
+    def end_request(self, profile):
+        """Stop profiling and fold this request into the worker's totals"""
+        profile.disable()
+        try:
+            with self._lock:
+                self._threads.discard(threading.get_ident())
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self._save_worker_dump()
+        finally:
+            self._busy.release()
+
+    # ==================== INTERNALS ====================
+
+    def _refresh(self, now: float):
+        self._next_check = now + self.check_interval
+        session = self._read_control()
+        if not session:
+            self._session = None
+            return
+        with self._lock:
+            if session["session"] != self._session:
+                self._session = session["session"]
+                self._stats = None
+                self._stacks = Counter()
+            self._until = session["until"]
+            self._sample_rate = session["sample_rate"]
+        if self._until > time.time() and (self._sampler is None or not self._sampler.is_alive()):
+            self._sampler = threading.Thread(target=self._sample_stacks, name="profiler-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample_stacks(self):
+        """Sample the stacks of threads serving profiled requests until the session ends"""
+        while time.time() < self._until:
+            time.sleep(self.sample_interval)
+            with self._lock:
+                idents = set(self._threads)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in idents:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _worker_prefix(self) -> str:
+        return os.path.join(self.output_dir, f"{self._session}-{os.getpid()}")
+
+    def _save_worker_dump(self):
+        prefix = self._worker_prefix()
+        self._stats.dump_stats(f"{prefix}.pstats")
+        with open(f"{prefix}.collapsed", 'w') as f:
+            for stack, count in self._stacks.items():
+                f.write(f"{stack} {count}\n")
+
+    def _read_control(self):
+        try:
+            with open(self.control_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_control(self, session: dict):
+        tmp_file = f"{self.control_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_file, self.control_file)
+
+    # ==================== DUMPS ====================
+
+    def _session_files(self, suffix: str):
+        session = (self._read_control() or {}).get("session")
+        if not session or not os.path.isdir(self.output_dir):
+            return []
+        return [
+            os.path.join(self.output_dir, name)
+            for name in sorted(os.listdir(self.output_dir))
+            if name.startswith(f"{session}-") and name.endswith(suffix)
+        ]
+
+    def dump_pstats(self) -> bytes:
+        """Merged marshalled pstats (load with pstats.Stats, snakeviz, gprof2dot)"""
+        files = self._session_files(".pstats")
+        if not files:
+            return b""
+        stats = pstats.Stats(*files)
+        merged = os.path.join(self.output_dir, "merged.pstats")
+        stats.dump_stats(merged)
+        with open(merged, 'rb') as f:
+            return f.read()
+
+    def dump_text(self, limit: int = 50) -> str:
+        """Merged per-function stats as text, sorted by cumulative time"""
+        files = self._session_files(".pstats")
+        if not files:
+            return ""
+        out = io.StringIO()
+        stats = pstats.Stats(*files, stream=out)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def dump_collapsed(self) -> str:
+        """Merged collapsed stacks ("a;b;c count" lines) for flamegraph.pl / speedscope"""
+        stacks = Counter()
+        for path in self._session_files(".collapsed"):
+            with open(path, 'r') as f:
+                for line in f:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    if stack:
+                        stacks[stack] += int(count)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,178 @@
+"""
+Replication - Read replicas that follow a primary's license change stream
+The primary serves its journal over /replication/changes; a replica polls it, applies the
+entries to its own store (keeping the primary's sequence numbers) and serves reads locally.
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows - single process dev server only
+    fcntl = None
+
+
+class Replicator:
+    def __init__(self, store, primary_url: str, secret: str, on_change=None,
+                 poll_interval: float = 1.0, timeout: float = 10.0, logger=None):
+        """
+        Initialize replicator
+
+        Args:
+            store: Local LicenseStore to apply changes to
+            primary_url: Base URL of the primary server
+            secret: Primary's SERVER_SECRET
+            on_change: Called with (table, changed hwids or None) after each apply
+            poll_interval: Seconds between polls when caught up
+        """
+        self.store = store
+        self.primary_url = primary_url.rstrip('/')
+        self.secret = secret
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.logger = logger
+        self.status_file = f"{store.json_file}.replication"
+        self.leader_file = f"{store.json_file}.replication.lock"
+        self._leader_lock = None
+        self._synced = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the background puller (one per worker; only the lock holder pulls)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="replicator", daemon=True)
+                self._thread.start()
+
+    def after_fork(self):
+        """Restart in a forked worker (os.register_at_fork after_in_child)
+        The child inherits the parent's state but not its thread: drop the inherited leader lock
+        (the parent's copy keeps holding it) so this worker has to win the lock itself."""
+        if self._leader_lock is not None:
+            self._leader_lock.close()
+        self._leader_lock = None
+        self._synced = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.start()
+
+    def _run(self):
+        while True:
+            if not self._become_leader():
+                time.sleep(self.poll_interval * 5)
+                continue
+            try:
+                caught_up = self.pull()
+            except Exception as e:
+                caught_up = True
+                if self.logger:
+                    self.logger.warning(f"Replication pull from {self.primary_url} failed: {e}")
+            if caught_up:
+                time.sleep(self.poll_interval)
+
+    def _become_leader(self) -> bool:
+        """Only one worker per replica pulls from the primary"""
+        if self._leader_lock is not None or fcntl is None:
+            return True
+        lock = open(self.leader_file, 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._leader_lock = lock  # held for the life of the worker
+        return True
+
+    def pull(self) -> bool:
+        """Fetch and apply one batch of changes. Returns True when caught up with the primary."""
+        if not self._synced:
+            self._resync()
+            return False
+
+        polled_at = time.time()
+        response = requests.get(
+            f"{self.primary_url}/replication/changes",
+            params={"since": self.store.seq, "password": self.secret},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get('resync'):
+            self._resync()
+            return False
+
+        changes = data.get('changes', [])
+        if changes:
+            table, changed = self.store.apply_changes(changes)
+            if self.on_change:
+                self.on_change(table, changed)
+        self._write_status(data['head'], polled_at)
+        return self.store.seq >= data['head']
+
+    def _resync(self):
+        """Replace the local table with a full copy from the primary"""
+        polled_at = time.time()
+        response = requests.get(
+            f"{self.primary_url}/replication/snapshot",
+            params={"password": self.secret},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        table, changed = self.store.load_export(data['seq'], data['licenses'])
+        if self.on_change:
+            self.on_change(table, changed)
+        self._synced = True
+        self._write_status(data['seq'], polled_at)
+        if self.logger:
+            self.logger.info(f"Replica resynced from {self.primary_url} at seq {data['seq']} "
+                             f"({len(data['licenses'])} licenses)")
+
+    def _write_status(self, primary_seq: int, polled_at: float):
+        """Record the primary's head as of a poll sent at polled_at
+        caught_up_at only moves forward when the local table had everything the primary had, so
+        a replica that falls behind (or stops hearing from the primary) shows growing lag."""
+        state = self._read_status()
+        state['primary_seq'] = primary_seq
+        state['synced_at'] = time.time()
+        if self.store.seq >= primary_seq:
+            state['caught_up_at'] = polled_at
+        tmp_file = f"{self.status_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.status_file)
+
+    def _read_status(self) -> dict:
+        try:
+            with open(self.status_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def status(self) -> dict:
+        """Replication lag as seen by any worker of this replica
+        lag_seconds is how long ago this replica last had every change the primary had."""
+        state = self._read_status()
+        local_seq = self.store.seq
+        primary_seq = state.get('primary_seq')
+        synced_at = state.get('synced_at')
+        caught_up_at = state.get('caught_up_at')
+        return {
+            "role": "replica",
+            "primary": self.primary_url,
+            "synced": synced_at is not None,
+            "seq": local_seq,
+            "primary_seq": primary_seq,
+            "lag_entries": max(0, primary_seq - local_seq) if primary_seq is not None else None,
+            "lag_seconds": round(time.time() - caught_up_at, 3) if caught_up_at else None
+        }